@@ -0,0 +1,201 @@
+"""Benchmarks for parsing and texture decoding. Doesn't need Blender.
+
+    python benchmarks/bench.py [--tris N] [--quads N] [--repeat N] [--scalar]
+    python benchmarks/bench.py --verify
+
+Times each stage on a synthetic dump (see synth_dump.py) and reports
+throughput, so regressions can be tracked between versions. With
+--verify, checks that the numpy texture decoders give exactly the same
+output as the pure Python one instead.
+"""
+
+import argparse
+import itertools
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from import_melon_rip.compat import np  # noqa: E402
+from import_melon_rip.rip import Rip  # noqa: E402
+from import_melon_rip.textures import (  # noqa: E402
+    TEXTURE_FORMAT_NAMES,
+    compressed_slot1_data,
+    decode_texture,
+    decode_texture_scalar,
+)
+
+from synth_dump import make_dump, vram_textures  # noqa: E402
+
+
+def best_time(fn, repeat):
+    """Runs fn repeat times and returns the fastest time."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name, seconds, amount=None, unit=None):
+    line = f"{name:<32} {seconds * 1000:10.2f} ms"
+    if amount is not None:
+        line += f"   {amount / seconds:14,.0f} {unit}/s"
+    print(line)
+
+
+def bench_parse(dump, repeat):
+    rip = Rip(dump)
+    num_polygons = rip.scan().num_polygons
+
+    report('scan', best_time(lambda: Rip(dump).scan(), repeat), num_polygons, 'polys')
+    report('parse', best_time(lambda: Rip(dump).parse(), repeat), num_polygons, 'polys')
+
+    # Gather the unfinalized colors to time finalize_colors on its own
+    tmp_colors = []
+    for run in rip.index.polygon_runs:
+        if (run.polygon_attr >> 4) & 3 != 3:
+            tmp_colors += rip.decode_polygons(run, 0, run.count)[1]
+    num_verts = len(tmp_colors) // 4
+    report('finalize_colors', best_time(lambda: rip.finalize_colors(tmp_colors), repeat), num_verts, 'verts')
+
+    # Time only the VRAM setup, not the scan parse_vram starts with
+    def parse_vram():
+        rip.loaded.discard('vram')
+        rip.parse_vram()
+    report('load_vram', best_time(parse_vram, repeat))
+
+
+def bench_textures(dump, repeat, scalar):
+    rip = Rip(dump)
+    rip.parse_vram()
+
+    for texparam, texpal in vram_textures():
+        texformat = (texparam >> 26) & 7
+        width = 8 << ((texparam >> 20) & 7)
+        height = 8 << ((texparam >> 23) & 7)
+        name = TEXTURE_FORMAT_NAMES[texformat]
+
+        t = best_time(lambda: decode_texture(rip, texparam, texpal), repeat)
+        report(f'decode_texture {name}', t, width * height, 'texels')
+
+        if scalar:
+            t = best_time(lambda: decode_texture_scalar(rip, texparam, texpal), 1)
+            report(f'decode_texture_scalar {name}', t, width * height, 'texels')
+
+
+def verify_cases():
+    """Yields the (texparam, texpal) of the textures --verify checks."""
+    sizes = [(0, 0), (3, 2)]  # 8x8, 64x32
+    # Near the start of VRAM, in the middle, and close enough to the end
+    # that the texture wraps around
+    vramaddrs = [0x00000, 0x2A468, 0x7FF00]
+    # Palette bases, the last one wrapping around the end of palette VRAM
+    texpals = [0x0000, 0x0155, 0x1FFF]
+
+    for texformat in range(1, 8):
+        for (size_s, size_t), vramaddr, alpha0, texpal in itertools.product(
+            sizes, vramaddrs, [0, 1], texpals,
+        ):
+            texparam = (
+                (vramaddr >> 3) |
+                (size_s << 20) | (size_t << 23) |
+                (texformat << 26) |
+                (alpha0 << 29)
+            )
+            yield texparam, texpal
+
+    # Compressed textures in slot 0 and slot 2, whose palette info is in
+    # the second half of slot 1. They're big enough that the random
+    # palette info uses every palmode (verify checks this).
+    for vramaddr in [0x00000, 0x1F000, 0x40000, 0x5F000]:
+        for alpha0 in [0, 1]:
+            texparam = (
+                (vramaddr >> 3) |
+                (4 << 20) | (4 << 23) |  # 128x128
+                (5 << 26) |
+                (alpha0 << 29)
+            )
+            yield texparam, 0x0155
+
+
+def verify(dump):
+    """Compares decode_texture with decode_texture_scalar for every case
+    from verify_cases. Returns the number of mismatches."""
+    if np is None:
+        print("numpy isn't installed; nothing to verify")
+        return 0
+
+    rip = Rip(dump)
+    rip.parse_vram()
+
+    failures = 0
+    num_cases = 0
+    palmodes = set()
+    for texparam, texpal in verify_cases():
+        num_cases += 1
+        if (texparam >> 26) & 7 == 5:
+            width = 8 << ((texparam >> 20) & 7)
+            height = 8 << ((texparam >> 23) & 7)
+            slot1 = compressed_slot1_data(rip, (texparam & 0xFFFF) << 3, width*height // 16)
+            palmodes.update(word >> 14 for word in struct.unpack('<%dH' % (len(slot1) // 2), slot1))
+        pixels, is_opaque = decode_texture(rip, texparam, texpal)
+        expected_pixels, expected_is_opaque = decode_texture_scalar(rip, texparam, texpal)
+        # The numpy decoders give float32s
+        pixels = np.asarray(pixels, dtype=np.float32)
+        expected_pixels = np.asarray(expected_pixels, dtype=np.float32)
+        if is_opaque != expected_is_opaque or not np.array_equal(pixels, expected_pixels):
+            failures += 1
+            texformat = (texparam >> 26) & 7
+            print(f"MISMATCH {TEXTURE_FORMAT_NAMES[texformat]:<10} "
+                  f"texparam={texparam:#010x} texpal={texpal:#06x}")
+
+    print(f"{num_cases - failures} of {num_cases} textures match")
+
+    if palmodes != {0, 1, 2, 3}:
+        failures += 1
+        print(f"Compressed textures only used palmodes {sorted(palmodes)}")
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tris', type=int, default=50000)
+    parser.add_argument('--quads', type=int, default=50000)
+    parser.add_argument('--state-change-every', type=int, default=100)
+    parser.add_argument('--version', type=int, choices=[1, 2], default=2)
+    parser.add_argument('--repeat', type=int, default=5,
+        help='times to run each benchmark; the best time is reported')
+    parser.add_argument('--scalar', action='store_true',
+        help='also time the pure Python texture decoder')
+    parser.add_argument('--verify', action='store_true',
+        help="check the numpy texture decoders against the pure Python one "
+             "instead of timing anything")
+    args = parser.parse_args()
+
+    if args.verify:
+        # Only the VRAM matters; it's random either way
+        sys.exit(1 if verify(make_dump(num_tris=0, num_quads=0, seed=0)) else 0)
+
+    dump = make_dump(
+        num_tris=args.tris,
+        num_quads=args.quads,
+        state_change_every=args.state_change_every,
+        version=args.version,
+        seed=0,
+    )
+    print(f"Synthetic dump: {args.tris} tris, {args.quads} quads, "
+          f"{len(dump) / 2**20:.1f} MiB")
+    print()
+
+    bench_parse(dump, args.repeat)
+    print()
+    bench_textures(dump, args.repeat, args.scalar)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Generates synthetic MelonRipper .dump files for benchmarking.
+
+    python benchmarks/synth_dump.py out.dump [--tris N] [--quads N] ...
+
+The dumps are valid but meaningless: random vertices, and random texel
+and palette data. Every texture format (1-7, including compressed) is
+present in VRAM, and the polygons cycle through them.
+"""
+
+import argparse
+import random
+import struct
+
+
+MAGIC_LEN = 24
+
+# Texture size for the generated textures, as the texparam size field
+# (width = 8 << TEX_SIZE)
+TEX_SIZE = 3  # 64x64
+
+
+def make_dump(
+    num_tris=10000,
+    num_quads=10000,
+    state_change_every=100,
+    version=2,
+    seed=0,
+):
+    """Returns the contents of a synthetic .dump file.
+
+    Polygons are emitted in runs of state_change_every, alternating
+    between TRI and QUAD runs until each count is used up. Between runs
+    there's a TPRM/TPLT/PATR state change, cycling through the textures
+    in VRAM. Version 1 dumps have no DISP or TOON records.
+    """
+    rng = random.Random(seed)
+    out = bytearray()
+
+    magic = b'melon ripper v%d' % version
+    out += magic + b'\0' * (MAGIC_LEN - len(magic))
+
+    vram = make_vram(rng)
+    textures = vram_textures()
+
+    remaining = {b'TRI ': num_tris, b'QUAD': num_quads}
+    op = b'TRI '
+    run_index = 0
+    while remaining[b'TRI '] or remaining[b'QUAD']:
+        if not remaining[op]:
+            op = b'QUAD' if op == b'TRI ' else b'TRI '
+
+        texparam, texpal = textures[run_index % len(textures)]
+        blend_mode = run_index % 3  # modulate, decal, toon/highlight
+        poly_alpha = 31 if run_index % 4 else 20
+        polygon_attr = (blend_mode << 4) | (1 << 6) | (poly_alpha << 16)
+        out += b'TPRM' + struct.pack('<I', texparam)
+        out += b'TPLT' + struct.pack('<I', texpal)
+        out += b'PATR' + struct.pack('<I', polygon_attr)
+
+        count = min(state_change_every, remaining[op])
+        remaining[op] -= count
+        nverts = 3 if op == b'TRI ' else 4
+        for _ in range(count):
+            out += op
+            for _ in range(nverts):
+                out += make_vertex(rng)
+
+        op = b'QUAD' if op == b'TRI ' else b'TRI '
+        run_index += 1
+
+    out += vram
+
+    if version >= 2:
+        out += b'DISP' + struct.pack('<I', 0)
+        toon_table = [rng.randrange(0x8000) for _ in range(32)]
+        out += b'TOON' + struct.pack('<32H', *toon_table)
+
+    return bytes(out)
+
+
+def make_vertex(rng):
+    x, y, z = (rng.randrange(-1 << 16, 1 << 16) for _ in range(3))
+    # melonDS stores colors as (c << 12) + 0xFFF
+    r, g, b = ((rng.randrange(32) << 12) + 0xFFF for _ in range(3))
+    s, t = (rng.randrange(-1024, 1024) for _ in range(2))
+    return struct.pack('<3i3i2h', x, y, z, r, g, b, s, t)
+
+
+def make_vram(rng):
+    """Returns the VRAM record, holding the textures from vram_textures()."""
+    # Banks A-D are mapped to texture slots 0-3, bank E to palette slots
+    # 0-3, and F and G to palette slots 4 and 5.
+    map_texture = [1 << 0, 1 << 1, 1 << 2, 1 << 3]
+    map_texpal = [1 << 4] * 4 + [1 << 5, 1 << 6, 0, 0]
+
+    # Texel and palette data is random. For the compressed texture, that
+    # includes the slot1 palette info, so all four palmodes get used.
+    tex = bytes(rng.getrandbits(8) for _ in range(4 * (128 << 10)))
+    banks_efg = bytes(rng.getrandbits(8) for _ in range(6 * (16 << 10)))
+
+    record = b'VRAM'
+    record += struct.pack('<4I', *map_texture)
+    record += struct.pack('<8I', *map_texpal)
+    record += tex
+    record += banks_efg
+    return record
+
+
+def vram_textures():
+    """Returns a list of the (texparam, texpal) of the textures in a
+    synthetic dump's VRAM, one for each format 1-7."""
+    width = height = 8 << TEX_SIZE
+
+    textures = []
+    addr = 0
+    for texformat in range(1, 8):
+        bpp = {1: 8, 2: 2, 3: 4, 4: 8, 5: 2, 6: 8, 7: 16}[texformat]
+        texparam = (
+            (addr >> 3) |
+            (1 << 16) | (1 << 17) |  # repeat S and T
+            (TEX_SIZE << 20) | (TEX_SIZE << 23) |
+            (texformat << 26) |
+            (1 << 29)  # transparent alpha0
+        )
+        texpal = texformat * 0x10
+        textures.append((texparam, texpal))
+        addr += width * height * bpp // 8
+
+    return textures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('output')
+    parser.add_argument('--tris', type=int, default=10000)
+    parser.add_argument('--quads', type=int, default=10000)
+    parser.add_argument('--state-change-every', type=int, default=100)
+    parser.add_argument('--version', type=int, choices=[1, 2], default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    dump = make_dump(
+        num_tris=args.tris,
+        num_quads=args.quads,
+        state_change_every=args.state_change_every,
+        version=args.version,
+        seed=args.seed,
+    )
+    with open(args.output, 'wb') as f:
+        f.write(dump)
+
+
+if __name__ == '__main__':
+    main()
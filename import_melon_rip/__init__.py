@@ -0,0 +1,30 @@
+# ███╗   ███╗███████╗██╗      ██████╗ ███╗   ██╗██████╗ ██╗██████╗ ██████╗ ███████╗██████╗
+# ████╗ ████║██╔════╝██║     ██╔═══██╗████╗  ██║██╔══██╗██║██╔══██╗██╔══██╗██╔════╝██╔══██╗
+# ██╔████╔██║█████╗  ██║     ██║   ██║██╔██╗ ██║██████╔╝██║██████╔╝██████╔╝█████╗  ██████╔╝
+# ██║╚██╔╝██║██╔══╝  ██║     ██║   ██║██║╚██╗██║██╔══██╗██║██╔═══╝ ██╔═══╝ ██╔══╝  ██╔══██╗
+# ██║ ╚═╝ ██║███████╗███████╗╚██████╔╝██║ ╚████║██║  ██║██║██║     ██║     ███████╗██║  ██║
+# ╚═╝     ╚═╝╚══════╝╚══════╝ ╚═════╝ ╚═╝  ╚═══╝╚═╝  ╚═╝╚═╝╚═╝     ╚═╝     ╚══════╝╚═╝  ╚═╝
+
+bl_info = {
+    "name": "MelonRipper NDS Dumps",
+    "author": "scurest",
+    "version": (1, 0, 0),
+    "blender": (2, 82, 0),
+    "location": "File > Import",
+    "description": "Import scenes ripped from Nintendo DS with melonDS + MelonRipper",
+    "doc_url": "https://github.com/scurest/MelonRipper",
+    "category": "Import",
+}
+
+
+# Only the Blender side of the addon imports bpy, so the parsing and
+# decoding modules can also be used outside of Blender.
+
+def register():
+    from . import blender
+    blender.register()
+
+
+def unregister():
+    from . import blender
+    blender.unregister()
@@ -0,0 +1,117 @@
+"""Command-line converter from .dump files to glTF, without Blender.
+
+    python -m import_melon_rip [-o OUTDIR] [--format glb|gltf] [-j N] [--weld]
+                               [--polygon-ids IDS] [--opaque-only] DUMP...
+
+DUMP can be a .dump file (or .dump.gz, .dump.xz, .dump.zst) or a
+directory of them.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+from .gltf import convert_dump
+from .rip import (
+    PolygonFilter,
+    ShowErrorMsg,
+    is_dump_path,
+    parse_polygon_ids,
+    strip_dump_extension,
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m import_melon_rip',
+        description='Convert MelonRipper .dump files to glTF + PNG textures.',
+    )
+    parser.add_argument('dumps', nargs='+', metavar='DUMP',
+        help='.dump file, or directory of .dump files')
+    parser.add_argument('-o', '--outdir', default='.',
+        help='directory to write output to (default: current directory)')
+    parser.add_argument('--format', choices=['glb', 'gltf'], default='glb',
+        help='output format (default: glb)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='number of dumps to convert in parallel; 0 means one per CPU')
+    parser.add_argument('--sidecar', action='store_true',
+        help='cache parsed dumps in .ripcache files next to them')
+    parser.add_argument('--weld', action='store_true',
+        help='merge identical vertices so faces are connected')
+    parser.add_argument('--polygon-ids', metavar='IDS',
+        help='only convert polygons with these polygon IDs, eg. "0-3,8"')
+    parser.add_argument('--opaque-only', action='store_true',
+        help='only convert polygons with full alpha')
+    args = parser.parse_args(argv)
+
+    polygon_filter = None
+    if args.polygon_ids is not None or args.opaque_only:
+        try:
+            polygon_ids = None if args.polygon_ids is None else parse_polygon_ids(args.polygon_ids)
+        except ShowErrorMsg as e:
+            parser.error(e.args[0])
+        polygon_filter = PolygonFilter(
+            polygon_ids=polygon_ids,
+            alphas=[31] if args.opaque_only else None,
+        )
+
+    filepaths = []
+    for path in args.dumps:
+        if os.path.isdir(path):
+            filepaths += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if is_dump_path(name)
+            )
+        else:
+            filepaths.append(path)
+
+    os.makedirs(args.outdir, exist_ok=True)
+
+    jobs = [
+        (filepath, output_path(filepath, args.outdir, args.format))
+        for filepath in filepaths
+    ]
+
+    start_t = time.time()
+    failed = 0
+
+    num_workers = min(args.jobs or os.cpu_count() or 1, len(jobs))
+    if num_workers <= 1:
+        for filepath, outpath in jobs:
+            failed += not run_job(filepath, outpath, args.sidecar, args.weld, polygon_filter)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [
+                pool.submit(run_job, filepath, outpath, args.sidecar, args.weld, polygon_filter)
+                for filepath, outpath in jobs
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                failed += not future.result()
+
+    elapsed = time.time() - start_t
+    print(f"Converted {len(jobs) - failed} of {len(jobs)} dumps in {elapsed:.1f} s")
+
+    return 1 if failed else 0
+
+
+def output_path(filepath, outdir, format):
+    name = strip_dump_extension(os.path.basename(filepath))
+    return os.path.join(outdir, name + '.' + format)
+
+
+def run_job(filepath, outpath, use_sidecar, use_weld, polygon_filter):
+    # Returns whether the conversion succeeded
+    try:
+        convert_dump(filepath, outpath, use_sidecar, use_weld, polygon_filter)
+    except Exception as e:
+        print(f"Failed to convert '{filepath}': {e}", file=sys.stderr)
+        return False
+    print(f"{filepath} -> {outpath}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Packing clamped textures into atlas images. Doesn't depend on bpy."""
+
+from collections import namedtuple
+
+from .compat import np
+from .textures import texture_cache_key
+
+
+# An atlas image. pixels are RGBA floats, bottom row first, like
+# decode_texture's.
+AtlasPage = namedtuple('AtlasPage', 'width height pixels is_opaque')
+
+# Border of copied edge texels around each packed texture, so sampling
+# exactly at a texture's edge doesn't pick up its neighbor.
+PADDING = 1
+
+
+class Atlas:
+    """Result of build_atlas.
+
+    pages is a list of AtlasPages, and materials maps the key of each
+    material (in rip.materials) that uses an atlas page to the index of
+    that page.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.materials = {}
+
+
+def build_atlas(rip, textures, max_size=1024):
+    """Packs the textures of clamped materials into atlas pages of at most
+    max_size x max_size, and rewrites the rip to use them.
+
+    textures maps texture_cache_key to the (pixels, is_opaque) from
+    decode_texture, for every texture the rip uses. The UVs of affected
+    faces are remapped in rip.uvs, and materials that only differed in
+    their texture are merged in rip.materials and rip.face_materials.
+
+    A material is only packed if its textures clamp in both directions
+    and all its UVs are inside the texture, since nothing can clamp to an
+    atlas cell. Returns an Atlas.
+    """
+    atlas = Atlas()
+    materials = list(rip.materials)
+
+    # Find the materials that can be packed
+    candidates = {}  # material index -> texture_cache_key
+    for material_index, (texparam, texpal, _polygon_attr) in enumerate(materials):
+        texformat = (texparam >> 26) & 7
+        repeat = (texparam >> 16) & 3
+        width = 8 << ((texparam >> 20) & 7)
+        height = 8 << ((texparam >> 23) & 7)
+        if texformat == 0 or repeat:
+            continue
+        if max(width, height) + 2*PADDING > max_size:
+            continue
+        candidates[material_index] = texture_cache_key(texparam, texpal)
+
+    uvs = rip.uvs
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        if material_index not in candidates:
+            continue
+        for i in face:
+            u, v = uvs[2*i], uvs[2*i + 1]
+            if not (0 <= u <= 1 and 0 <= v <= 1):
+                del candidates[material_index]
+                break
+
+    if not candidates:
+        return atlas
+
+    # Pack the textures. Opaque and transparent textures go in separate
+    # pages, so opaque materials don't become transparent.
+    placements = {}  # texture_cache_key -> (page index, x, y)
+    for is_opaque in [True, False]:
+        keys = sorted(
+            {key for key in candidates.values() if textures[key][1] == is_opaque},
+            key=lambda key: (-key[2], -key[1]),  # tallest first
+        )
+        if not keys:
+            continue
+        for page_keys, page_placements, width, height in pack_shelves(keys, max_size):
+            page_index = len(atlas.pages)
+            atlas.pages.append(AtlasPage(
+                width=width,
+                height=height,
+                pixels=blit_page(width, height, page_keys, page_placements, textures),
+                is_opaque=is_opaque,
+            ))
+            for key, (x, y) in zip(page_keys, page_placements):
+                placements[key] = (page_index, x, y)
+
+    # Remap the UVs of the packed faces into their page
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        key = candidates.get(material_index)
+        if key is None:
+            continue
+        page_index, x, y = placements[key]
+        page = atlas.pages[page_index]
+        width, height = key[1], key[2]
+        for i in face:
+            uvs[2*i] = (x + uvs[2*i] * width) / page.width
+            uvs[2*i + 1] = (y + uvs[2*i + 1] * height) / page.height
+
+    # Merge materials that now share a page and would otherwise make the
+    # same material
+    merged = {}
+    new_keys = []  # the new key of each material
+    for material_index, material_args in enumerate(materials):
+        texparam, _texpal, polygon_attr = material_args
+        key = candidates.get(material_index)
+        if key is None:
+            new_keys.append(material_args)
+            continue
+        page_index = placements[key][0]
+        merge_key = (page_index, polygon_attr, texparam & (7<<26 | 1<<29))
+        # The first material merged stands in for the rest
+        new_key = merged.setdefault(merge_key, material_args)
+        atlas.materials[new_key] = page_index
+        new_keys.append(new_key)
+
+    new_materials = {}
+    for new_key in new_keys:
+        new_materials.setdefault(new_key, len(new_materials))
+    remap = [new_materials[new_key] for new_key in new_keys]
+
+    rip.materials = new_materials
+    rip.face_materials = [remap[i] for i in rip.face_materials]
+
+    return atlas
+
+
+def pack_shelves(keys, max_size):
+    """Packs textures (given by their texture_cache_key, sorted tallest
+    first) into pages with a simple shelf packer. Yields
+    (keys, placements, width, height) for each page, where placements are
+    the (x, y) of each texture's bottom-left corner."""
+    def padded_size(key):
+        return key[1] + 2*PADDING, key[2] + 2*PADDING
+
+    # Aim for a roughly square page
+    area = sum(w * h for w, h in map(padded_size, keys))
+    width = max(padded_size(key)[0] for key in keys)
+    while width * width < area and width * 2 <= max_size:
+        width *= 2
+    width = min(width, max_size)
+
+    page_keys, placements = [], []
+    x = y = shelf_height = 0
+    for key in keys:
+        w, h = padded_size(key)
+        if x + w > width:
+            # Next shelf
+            x, y = 0, y + shelf_height
+            shelf_height = 0
+        if y + h > max_size:
+            yield page_keys, placements, width, y + shelf_height
+            page_keys, placements = [], []
+            x = y = shelf_height = 0
+        page_keys.append(key)
+        placements.append((x + PADDING, y + PADDING))
+        x += w
+        shelf_height = max(shelf_height, h)
+
+    yield page_keys, placements, width, y + shelf_height
+
+
+def blit_page(width, height, keys, placements, textures):
+    """Returns the pixels for an atlas page, with the textures copied in
+    at their placements and their edges extended into the padding."""
+    if np is not None:
+        page = np.zeros((height, width, 4), dtype=np.float32)
+        for key, (x, y) in zip(keys, placements):
+            w, h = key[1], key[2]
+            tex = np.asarray(textures[key][0], dtype=np.float32).reshape(h, w, 4)
+            padded = np.pad(tex, ((PADDING, PADDING), (PADDING, PADDING), (0, 0)), mode='edge')
+            page[y - PADDING : y + h + PADDING, x - PADDING : x + w + PADDING] = padded
+        return page.ravel()
+
+    page = [0.0] * (width * height * 4)
+    for key, (x, y) in zip(keys, placements):
+        w, h = key[1], key[2]
+        pixels = textures[key][0]
+        rows = [list(pixels[4*w*r : 4*w*(r+1)]) for r in range(h)]
+        rows = [rows[0]] * PADDING + rows + [rows[-1]] * PADDING
+        for r, row in enumerate(rows):
+            row = row[:4] * PADDING + row + row[-4:] * PADDING
+            start = ((y - PADDING + r) * width + (x - PADDING)) * 4
+            page[start : start + len(row)] = row
+    return page
@@ -0,0 +1,189 @@
+"""Loading many dumps in parallel worker processes. Doesn't depend on bpy."""
+
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+
+from .atlas import build_atlas
+from .rip import load_rip, weld_vertices
+from .stats import ImportStats
+from .textures import decode_textures, used_textures
+
+
+def load_and_decode(
+    filepath,
+    use_sidecar=False,
+    disk_cache=None,
+    use_atlas=False,
+    use_weld=False,
+    polygon_filter=None,
+    stats=None,
+    texture_jobs=1,
+):
+    """Parses a dump and decodes every texture its materials use. Returns
+    (rip, textures, atlas, stats), where textures maps texture_cache_key
+    to the (pixels, is_opaque) from decode_texture, atlas is the Atlas
+    from build_atlas with use_atlas (otherwise None), and stats is the
+    ImportStats for the work done here. With use_weld, the rip's
+    vertices are welded with weld_vertices. polygon_filter is passed on
+    to load_rip, and texture_jobs to decode_textures."""
+    if stats is None:
+        stats = ImportStats()
+    rip = load_rip(filepath, use_sidecar, stats, polygon_filter)
+
+    textures = decode_textures(
+        rip, used_textures(rip),
+        disk_cache=disk_cache,
+        stats=stats,
+        jobs=texture_jobs,
+    )
+
+    atlas = None
+    if use_atlas:
+        with stats.phase('atlas packing'):
+            atlas = build_atlas(rip, textures)
+        stats.count('atlas pages', len(atlas.pages))
+
+    if use_weld:
+        # After packing, which needs every face to have its own vertices
+        with stats.phase('weld'):
+            stats.count('welded vertices', weld_vertices(rip))
+
+    return rip, textures, atlas, stats
+
+
+def load_batch(
+    filepaths,
+    jobs=0,
+    use_sidecar=False,
+    disk_cache=None,
+    use_atlas=False,
+    use_weld=False,
+    polygon_filter=None,
+    cancel=None,
+    executable=None,
+):
+    """Runs load_and_decode on every dump, in up to jobs worker processes
+    (0 means one per CPU). Yields (filepath, result, error) for each dump
+    in the order they finish; error is the exception if it failed.
+
+    Setting the optional threading.Event cancel (or closing the
+    generator) stops it: dumps that haven't started yet are dropped, and
+    nothing waits for the ones still running in a worker.
+
+    executable is the Python interpreter to start workers with, if it's
+    not sys.executable.
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(filepaths))
+
+    if jobs <= 1:
+        for filepath in filepaths:
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                result = load_and_decode(
+                    filepath, use_sidecar, disk_cache, use_atlas, use_weld, polygon_filter,
+                )
+            except Exception as e:
+                yield filepath, None, e
+            else:
+                yield filepath, result, None
+        return
+
+    # Always start fresh interpreters; forking Blender isn't safe
+    ctx = multiprocessing.get_context('spawn')
+    if executable:
+        ctx.set_executable(executable)
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=ctx)
+    pending = set()
+    try:
+        futures = {
+            pool.submit(
+                load_and_decode,
+                filepath, use_sidecar, disk_cache, use_atlas, use_weld, polygon_filter,
+            ): filepath
+            for filepath in filepaths
+        }
+        pending = set(futures)
+        while pending:
+            # Wake up now and then to check for cancellation
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=0.1,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                if cancel is not None and cancel.is_set():
+                    return
+                filepath = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield filepath, None, e
+                else:
+                    yield filepath, result, None
+            if cancel is not None and cancel.is_set():
+                return
+    finally:
+        if pending:
+            shutdown_without_waiting(pool, pending)
+        else:
+            pool.shutdown()
+
+
+def shutdown_without_waiting(pool, pending):
+    # Shuts down a ProcessPoolExecutor, cancelling the pending futures
+    # that haven't started. The ones already running finish in their
+    # worker, but nothing waits for them.
+    try:
+        pool.shutdown(wait=False, cancel_futures=True)
+    except TypeError:
+        # cancel_futures is new in Python 3.9
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def iter_in_background(iterable, cancel):
+    """Runs through an iterable (eg. load_batch) in a worker thread.
+    Yields its items as they become ready, and None whenever none is
+    ready yet, so the caller never blocks. Setting the threading.Event
+    cancel makes the thread stop after the item it's working on; pass it
+    to the iterable too (see load_batch) to stop sooner than that."""
+    items = queue.Queue()
+    end = object()
+
+    def worker():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                items.put((item, None))
+                if cancel.is_set():
+                    break
+        except BaseException as e:
+            items.put((end, e))
+        else:
+            items.put((end, None))
+        finally:
+            # Let a generator clean up (eg. load_batch's worker processes)
+            # now rather than whenever it's garbage collected
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    while True:
+        try:
+            item, error = items.get_nowait()
+        except queue.Empty:
+            yield None
+            continue
+        if error is not None:
+            raise error
+        if item is end:
+            return
+        yield item
@@ -0,0 +1,1464 @@
+"""The Blender side of the addon: the import operator and creating
+Blender objects from a parsed dump."""
+
+import array
+import bpy
+import os
+import re
+import sys
+import threading
+import time
+
+from bpy.props import (
+    BoolProperty,
+    CollectionProperty,
+    EnumProperty,
+    FloatVectorProperty,
+    IntProperty,
+    StringProperty,
+)
+from bpy_extras.io_utils import ImportHelper
+
+from .batch import iter_in_background, load_and_decode, load_batch
+from .compat import np
+from .rip import (
+    PolygonFilter,
+    ShowErrorMsg,
+    is_dump_path,
+    load_rip,
+    parse_polygon_ids,
+    strip_dump_extension,
+    weld_vertices,
+)
+from .stats import ImportStats
+from .textures import (
+    TEXTURE_FORMAT_NAMES,
+    TextureDiskCache,
+    decode_texture_cached,
+    decode_textures,
+    pixels_digest,
+    texture_cache_key,
+    used_textures,
+)
+
+
+class ImportMelonRipOp(bpy.types.Operator, ImportHelper):
+    """Load a MelonRipper DS .dump file"""
+    bl_idname = "import_model.melon_rip"
+    bl_label = "Import MelonRipper NDS Dump"
+    bl_options = {'PRESET', 'UNDO'}
+
+    filename_ext = ".dump"
+    filter_glob: StringProperty(
+        default="*.dump;*.dump.gz;*.dump.xz;*.dump.zst",
+        options={'HIDDEN'},
+    )
+
+    # For importing multiple files
+    files: CollectionProperty(
+        type=bpy.types.OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+    directory: StringProperty(
+        subtype='DIR_PATH',
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    jobs: IntProperty(
+        name="Worker Processes",
+        description=(
+            "When importing several dumps, how many processes to parse "
+            "them and decode their textures in. 0 uses one per CPU"
+        ),
+        default=0,
+        min=0,
+    )
+
+    as_sequence: BoolProperty(
+        name="Import as Sequence",
+        description=(
+            "Treat the selected dumps as consecutive frames of an "
+            "animation, in filename order, and import them as one "
+            "animated object"
+        ),
+        default=False,
+    )
+
+    use_background: BoolProperty(
+        name="Import in Background",
+        description=(
+            "Parse and decode in a background thread, and create the "
+            "Blender objects a bit at a time, so the UI stays usable. "
+            "Progress is shown in the status bar; press Esc to cancel"
+        ),
+        default=False,
+    )
+
+    use_texture_cache: BoolProperty(
+        name="Use Texture Cache",
+        description=(
+            "Keep decoded textures in an on-disk cache and reuse them in "
+            "later imports. The location and size are set in the addon "
+            "preferences"
+        ),
+        default=False,
+    )
+
+    use_sidecar: BoolProperty(
+        name="Cache Parsed Dump",
+        description=(
+            "Save the parsed dump to a .ripcache file next to it, and "
+            "reuse that instead of parsing again when the dump is "
+            "reimported unchanged"
+        ),
+        default=False,
+    )
+
+    use_atlas: BoolProperty(
+        name="Pack Clamped Textures",
+        description=(
+            "Pack the textures of materials that don't repeat into atlas "
+            "images, and merge materials that only differed in their "
+            "texture. Gives far fewer images and materials"
+        ),
+        default=False,
+    )
+
+    use_weld: BoolProperty(
+        name="Weld Vertices",
+        description=(
+            "Merge vertices with the same position, color, UV and "
+            "material, so faces are connected again. Every polygon in a "
+            "dump has its own vertices otherwise"
+        ),
+        default=False,
+    )
+
+    filter_polygon_ids: StringProperty(
+        name="Polygon IDs",
+        description=(
+            "Only import polygons with these polygon IDs (0-63), eg. "
+            "\"0-3, 8\". Leave blank to import every ID"
+        ),
+        default='',
+    )
+
+    filter_alpha: EnumProperty(
+        name="Alpha",
+        description="Only import polygons with this kind of polygon alpha",
+        items=[
+            ('ALL', "All", "Import all polygons"),
+            ('OPAQUE', "Opaque", "Only polygons with full alpha"),
+            ('TRANSLUCENT', "Translucent", "Only polygons with less than full alpha"),
+        ],
+        default='ALL',
+    )
+
+    filter_modes: EnumProperty(
+        name="Polygon Modes",
+        description="Only import polygons drawn with these polygon modes",
+        items=[
+            ('0', "Modulate", ""),
+            ('1', "Decal", ""),
+            ('2', "Toon/Highlight", ""),
+        ],
+        options={'ENUM_FLAG'},
+        default={'0', '1', '2'},
+    )
+
+    filter_texture_formats: EnumProperty(
+        name="Texture Formats",
+        description="Only import polygons with these texture formats",
+        items=[('0', "Untextured", "")] + [
+            (str(texformat), name[0].upper() + name[1:], "")
+            for texformat, name in TEXTURE_FORMAT_NAMES.items()
+        ],
+        options={'ENUM_FLAG'},
+        default={str(texformat) for texformat in range(8)},
+    )
+
+    use_bounds: BoolProperty(
+        name="Limit to Box",
+        description=(
+            "Only import polygons whose vertices are all inside the box "
+            "from Box Min to Box Max"
+        ),
+        default=False,
+    )
+
+    bounds_min: FloatVectorProperty(
+        name="Box Min",
+        subtype='XYZ',
+        default=(-1.0, -1.0, -1.0),
+    )
+
+    bounds_max: FloatVectorProperty(
+        name="Box Max",
+        subtype='XYZ',
+        default=(1.0, 1.0, 1.0),
+    )
+
+    skip_validation: BoolProperty(
+        name="Skip Mesh Validation",
+        description=(
+            "Trust that the dump gives a well-formed mesh, and don't run "
+            "mesh validation on it. Faster for large dumps"
+        ),
+        default=False,
+    )
+
+    stats_filepath: StringProperty(
+        name="Stats File",
+        description=(
+            "If set, write the import's per-phase timings and counters to "
+            "this JSON file (they're always printed to the console)"
+        ),
+        subtype='FILE_PATH',
+        default='',
+    )
+
+    def execute(self, context):
+        start_t = time.time()
+        stats = ImportStats()
+
+        disk_cache = None
+        if self.use_texture_cache:
+            directory, size = '', 512
+            addon = context.preferences.addons.get(__package__)
+            if addon:  # not registered as an addon when run as a script
+                directory = addon.preferences.texture_cache_dir
+                size = addon.preferences.texture_cache_size
+            disk_cache = TextureDiskCache(
+                directory=bpy.path.abspath(directory) or default_texture_cache_dir(),
+                max_bytes=size << 20,
+            )
+
+        filepaths = self.selected_filepaths()
+        if not filepaths:
+            self.report({'ERROR'}, "No .dump files selected")
+            return {'CANCELLED'}
+
+        try:
+            polygon_filter = self.polygon_filter()
+        except ShowErrorMsg as e:
+            self.report({'ERROR'}, e.args[0])
+            return {'CANCELLED'}
+
+        if self.use_background and context.window is not None:
+            return self.start_background(
+                context, filepaths, disk_cache, polygon_filter, stats, start_t,
+            )
+
+        if len(filepaths) > 1:
+            import_many = import_sequence if self.as_sequence else import_batch
+            failed = import_many(
+                filepaths,
+                jobs=self.jobs,
+                disk_cache=disk_cache,
+                use_sidecar=self.use_sidecar,
+                use_atlas=self.use_atlas,
+                use_weld=self.use_weld,
+                polygon_filter=polygon_filter,
+                validate=not self.skip_validation,
+                stats=stats,
+            )
+
+            return self.finish(filepaths, failed, stats, start_t)
+
+        try:
+            import_rip(
+                filepaths[0],
+                disk_cache=disk_cache,
+                use_sidecar=self.use_sidecar,
+                use_atlas=self.use_atlas,
+                use_weld=self.use_weld,
+                polygon_filter=polygon_filter,
+                validate=not self.skip_validation,
+                stats=stats,
+            )
+
+        except ShowErrorMsg as e:
+            self.report({'ERROR'}, e.args[0])
+            return {'CANCELLED'}
+
+        end_t = time.time()
+        elapsed = end_t - start_t
+
+        print(f"Imported '{filepaths[0]}' in {elapsed:.1f} s")
+        self.report_stats(stats)
+
+        return {'FINISHED'}
+
+    def start_background(self, context, filepaths, disk_cache, polygon_filter, stats, start_t):
+        # Loading happens in a thread; the Blender objects are created
+        # from it on timer ticks in modal
+        self.cancel_loading = threading.Event()
+        results = iter_in_background(
+            load_batch(
+                filepaths,
+                jobs=self.jobs,
+                use_sidecar=self.use_sidecar,
+                disk_cache=disk_cache,
+                use_atlas=self.use_atlas,
+                use_weld=self.use_weld,
+                polygon_filter=polygon_filter,
+                cancel=self.cancel_loading,
+                executable=python_executable(),
+            ),
+            self.cancel_loading,
+        )
+        validate = not self.skip_validation
+        if self.as_sequence and len(filepaths) > 1:
+            self.steps = iter_import_sequence(results, filepaths, validate, stats)
+        else:
+            self.steps = iter_import_batch(results, len(filepaths), validate, stats)
+
+        self.filepaths = filepaths
+        self.disk_cache = disk_cache
+        self.stats = stats
+        self.start_t = start_t
+        self.status_text = "Loading dumps"
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self.timer = wm.event_timer_add(0.05, window=context.window)
+        wm.modal_handler_add(self)
+        self.show_progress(context, 0)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel_loading.set()
+            self.steps.close()
+            self.end_background(context)
+            self.report({'WARNING'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # Work for a little while each tick, so the UI stays responsive
+        deadline = time.perf_counter() + 0.05
+        try:
+            while time.perf_counter() < deadline:
+                progress = next(self.steps)
+                if progress is None:
+                    break  # waiting for the loading thread
+                fraction, self.status_text = progress
+                self.show_progress(context, fraction)
+
+        except StopIteration as e:
+            self.end_background(context)
+            if self.disk_cache is not None:
+                self.disk_cache.trim()
+            return self.finish(self.filepaths, e.value, self.stats, self.start_t)
+
+        except Exception:
+            self.cancel_loading.set()
+            self.end_background(context)
+            raise
+
+        return {'PASS_THROUGH'}
+
+    def show_progress(self, context, fraction):
+        context.window_manager.progress_update(round(fraction * 100))
+        context.workspace.status_text_set(f"{self.status_text}... (Esc to cancel)")
+
+    def end_background(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def finish(self, filepaths, failed, stats, start_t):
+        if len(filepaths) == 1 and failed:
+            error = failed[0][1]
+            self.report({'ERROR'}, error.args[0] if isinstance(error, ShowErrorMsg) else str(error))
+            return {'CANCELLED'}
+
+        for filepath, error in failed:
+            print(f"Failed to import '{filepath}': {error}")
+        if failed:
+            self.report(
+                {'WARNING'},
+                f"Couldn't import {len(failed)} of {len(filepaths)} "
+                "dumps; see the console for details",
+            )
+
+        elapsed = time.time() - start_t
+        print(f"Imported {len(filepaths) - len(failed)} dumps in {elapsed:.1f} s")
+        self.report_stats(stats)
+
+        return {'FINISHED'}
+
+    def polygon_filter(self):
+        # Returns a PolygonFilter for the filter options, or None if they
+        # let everything through
+        polygon_ids = None
+        if self.filter_polygon_ids.strip():
+            polygon_ids = parse_polygon_ids(self.filter_polygon_ids)
+
+        alphas = {
+            'ALL': None,
+            'OPAQUE': [31],
+            'TRANSLUCENT': range(31),
+        }[self.filter_alpha]
+
+        modes = None
+        if len(self.filter_modes) < 3:
+            modes = [int(mode) for mode in self.filter_modes]
+
+        texture_formats = None
+        if len(self.filter_texture_formats) < 8:
+            texture_formats = [int(texformat) for texformat in self.filter_texture_formats]
+
+        bounds = None
+        if self.use_bounds:
+            bounds = (tuple(self.bounds_min), tuple(self.bounds_max))
+
+        if (polygon_ids, alphas, modes, texture_formats, bounds) == (None,) * 5:
+            return None
+        return PolygonFilter(polygon_ids, alphas, modes, texture_formats, bounds)
+
+    def report_stats(self, stats):
+        print(stats.report())
+        if self.stats_filepath:
+            path = bpy.path.abspath(self.stats_filepath)
+            try:
+                stats.save_json(path)
+            except OSError as e:
+                self.report({'WARNING'}, f"Couldn't write stats file: {e}")
+
+    def selected_filepaths(self):
+        # Always in filename order (whatever order the file browser is
+        # sorted in), since that's the frame order for as_sequence.
+        # A directory imports every dump in it.
+        if os.path.isdir(self.filepath):
+            return sorted(
+                (
+                    os.path.join(self.filepath, name)
+                    for name in os.listdir(self.filepath)
+                    if is_dump_path(name)
+                ),
+                key=natural_sort_key,
+            )
+
+        names = [f.name for f in self.files if f.name]
+        if len(names) > 1:
+            return sorted(
+                (os.path.join(self.directory, name) for name in names),
+                key=natural_sort_key,
+            )
+
+        return [self.filepath]
+
+
+class MelonRipPreferences(bpy.types.AddonPreferences):
+    bl_idname = __package__
+
+    texture_cache_dir: StringProperty(
+        name="Texture Cache",
+        description=(
+            "Directory for the on-disk texture cache. Leave blank to use "
+            "a directory in Blender's user data"
+        ),
+        subtype='DIR_PATH',
+    )
+
+    texture_cache_size: IntProperty(
+        name="Max Size (MB)",
+        description=(
+            "When the texture cache grows larger than this, the least "
+            "recently used textures are removed"
+        ),
+        default=512,
+        min=1,
+    )
+
+    def draw(self, context):
+        self.layout.prop(self, 'texture_cache_dir')
+        self.layout.prop(self, 'texture_cache_size')
+
+
+def natural_sort_key(path):
+    # Sorts runs of digits by their value, so frame10 comes after frame2
+    return [
+        (1, int(part), part) if part.isdigit() else (0, 0, part)
+        for part in re.split(r'(\d+)', path)
+    ]
+
+
+def default_texture_cache_dir():
+    return bpy.utils.user_resource('DATAFILES', path='melonripper_texture_cache')
+
+
+def menu_func_import(self, context):
+    self.layout.operator(ImportMelonRipOp.bl_idname, text="MelonRipper NDS Dump")
+
+
+def register():
+    bpy.utils.register_class(MelonRipPreferences)
+    bpy.utils.register_class(ImportMelonRipOp)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.app.handlers.frame_change_pre.append(swap_sequence_meshes)
+
+
+def unregister():
+    if swap_sequence_meshes in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(swap_sequence_meshes)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.utils.unregister_class(ImportMelonRipOp)
+    bpy.utils.unregister_class(MelonRipPreferences)
+
+
+def import_rip(
+    filepath,
+    disk_cache=None,
+    use_sidecar=False,
+    use_atlas=False,
+    use_weld=False,
+    polygon_filter=None,
+    validate=True,
+    stats=None,
+):
+    if stats is None:
+        stats = ImportStats()
+
+    if use_atlas:
+        # All the textures need to be decoded up front to pack them
+        rip, textures, atlas, _stats = load_and_decode(
+            filepath, use_sidecar, disk_cache, use_atlas, use_weld, polygon_filter, stats,
+            texture_jobs=0,
+        )
+        importer = Importer(
+            dump_name(filepath), rip,
+            decoded_textures=textures,
+            atlas=atlas,
+            validate=validate,
+            stats=stats,
+        )
+    else:
+        rip = load_rip(filepath, use_sidecar, stats, polygon_filter)
+        if use_weld:
+            with stats.phase('weld'):
+                stats.count('welded vertices', weld_vertices(rip))
+        importer = Importer(
+            dump_name(filepath), rip,
+            disk_cache=disk_cache,
+            validate=validate,
+            stats=stats,
+        )
+
+    importer.create_blender_objects()
+
+    if disk_cache is not None:
+        disk_cache.trim()
+
+
+def import_batch(
+    filepaths,
+    jobs=0,
+    disk_cache=None,
+    use_sidecar=False,
+    use_atlas=False,
+    use_weld=False,
+    polygon_filter=None,
+    validate=True,
+    stats=None,
+):
+    """Imports several dumps. Parsing and texture decoding run in worker
+    processes, and the Blender objects for each dump are created as soon
+    as it's ready. Identical textures share an image across the whole
+    batch, and the materials share node groups. Returns a list of
+    (filepath, error) for dumps that failed.
+
+    The workers' timings are added into stats too, so with several jobs
+    the phase times add up to more than the wall-clock time.
+    """
+    results = load_batch(
+        filepaths,
+        jobs=jobs,
+        use_sidecar=use_sidecar,
+        disk_cache=disk_cache,
+        use_atlas=use_atlas,
+        use_weld=use_weld,
+        polygon_filter=polygon_filter,
+        executable=python_executable(),
+    )
+    failed = run_steps(iter_import_batch(results, len(filepaths), validate, stats))
+
+    if disk_cache is not None:
+        disk_cache.trim()
+
+    return failed
+
+
+def import_sequence(
+    filepaths,
+    jobs=0,
+    disk_cache=None,
+    use_sidecar=False,
+    use_atlas=False,
+    use_weld=False,
+    polygon_filter=None,
+    validate=True,
+    stats=None,
+):
+    """Imports dumps of consecutive frames as one animated object, one
+    dump per frame from the scene's start frame. Images, materials and
+    node groups are shared by all the frames.
+
+    A frame with the same polygons, colors and UVs as the one before it
+    is added as a shape key that's only on for that frame. Otherwise it
+    gets a new mesh, and swap_sequence_meshes switches the object to it
+    on that frame. Returns a list of (filepath, error) for dumps that
+    failed.
+    """
+    results = load_batch(
+        filepaths,
+        jobs=jobs,
+        use_sidecar=use_sidecar,
+        disk_cache=disk_cache,
+        use_atlas=use_atlas,
+        use_weld=use_weld,
+        polygon_filter=polygon_filter,
+        executable=python_executable(),
+    )
+    failed = run_steps(iter_import_sequence(results, filepaths, validate, stats))
+
+    if disk_cache is not None:
+        disk_cache.trim()
+
+    return failed
+
+
+# The iter_* functions below do an import a step at a time, so a modal
+# operator can spread it over timer ticks. They take the results from
+# load_batch (which may also yield None while waiting for the next
+# result; see iter_in_background). They yield None while waiting, or
+# (fraction done, status text) after each step, and return what the
+# function they're for would.
+
+
+def run_steps(steps):
+    # Runs one of the iter_* generators to the end and returns its result
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+
+def iter_import_batch(results, num_dumps, validate=True, stats=None):
+    """Steps for import_batch."""
+    image_cache = {}
+    node_groups = NodeGroups()
+    failed = []
+    num_done = 0
+
+    for item in results:
+        if item is None:
+            yield None
+            continue
+
+        filepath, result, error = item
+        if error is not None:
+            failed.append((filepath, error))
+            num_done += 1
+            continue
+
+        rip, textures, atlas, worker_stats = result
+        if stats is not None:
+            stats.merge(worker_stats)
+        importer = Importer(
+            dump_name(filepath), rip,
+            decoded_textures=textures,
+            atlas=atlas,
+            image_cache=image_cache,
+            node_groups=node_groups,
+            validate=validate,
+            stats=stats,
+        )
+
+        text = f"Importing {importer.name} ({num_done + 1}/{num_dumps})"
+        steps = importer.iter_create_blender_objects()
+        for fraction in steps:
+            yield (num_done + fraction) / num_dumps, text
+        num_done += 1
+
+    return failed
+
+
+def iter_import_sequence(results, filepaths, validate=True, stats=None):
+    """Steps for import_sequence."""
+    if stats is None:
+        stats = ImportStats()
+
+    image_cache = {}
+    node_groups = NodeGroups()
+    material_cache = {}
+    failed = []
+
+    scene = bpy.context.scene
+    start_frame = scene.frame_start
+    ob = None
+    layout = None  # of the current mesh
+    frame_meshes = []  # name of the mesh for each frame
+
+    # Results come in as they finish; handle them in order
+    order = {filepath: i for i, filepath in enumerate(filepaths)}
+    finished = {}
+    next_index = 0
+    for item in results:
+        if item is None:
+            yield None
+            continue
+
+        filepath, result, error = item
+        finished[order[filepath]] = item
+
+        while next_index in finished:
+            filepath, result, error = finished.pop(next_index)
+            next_index += 1
+
+            if error is not None:
+                failed.append((filepath, error))
+                continue
+
+            rip, textures, atlas, worker_stats = result
+            stats.merge(worker_stats)
+            importer = Importer(
+                dump_name(filepath), rip,
+                decoded_textures=textures,
+                atlas=atlas,
+                image_cache=image_cache,
+                node_groups=node_groups,
+                material_cache=material_cache,
+                validate=validate,
+                stats=stats,
+            )
+
+            text = f"Importing frame {importer.name} ({next_index}/{len(filepaths)})"
+            steps = importer.iter_get_materials()
+            for fraction in steps:
+                yield (next_index - 1 + fraction / 2) / len(filepaths), text
+            materials = importer.materials
+
+            frame_layout = (
+                rip.faces,
+                [materials[i].name for i in rip.face_materials],
+                rip.colors,
+                rip.uvs,
+            )
+            frame = start_frame + len(frame_meshes)
+
+            if frame_layout == layout:
+                with stats.phase('shape keys'):
+                    add_frame_shape_key(ob, rip, importer.name, frame)
+                stats.count('shape key frames')
+            else:
+                mesh = importer.create_mesh()
+                if ob is None:
+                    ob = importer.create_object(mesh)
+                else:
+                    ob.data = mesh
+                layout = frame_layout
+                stats.count('mesh frames')
+
+            frame_meshes.append(ob.data.name)
+            yield next_index / len(filepaths), text
+
+    if ob is None:
+        return failed
+
+    if len(set(frame_meshes)) > 1:
+        ob['nds:sequence'] = frame_meshes
+        ob['nds:sequence_start'] = start_frame
+        for name in set(frame_meshes):
+            # Only the object's current mesh has a real user
+            bpy.data.meshes[name].use_fake_user = True
+        swap_sequence_meshes(scene)
+
+    scene.frame_end = max(scene.frame_end, start_frame + len(frame_meshes) - 1)
+
+    return failed
+
+
+def add_frame_shape_key(ob, rip, name, frame):
+    # Adds a shape key with the rip's vertex positions, keyframed to only
+    # be on for the given frame
+    if ob.data.shape_keys is None:
+        ob.shape_key_add(name='Basis', from_mix=False)
+    key_block = ob.shape_key_add(name=name, from_mix=False)
+
+    if np is not None:
+        co = np.array(rip.verts, dtype=np.float32).reshape(-1)
+    else:
+        co = array.array('f', (c for vert in rip.verts for c in vert))
+    key_block.data.foreach_set('co', co)
+
+    for f, value in [(frame - 1, 0.0), (frame, 1.0), (frame + 1, 0.0)]:
+        key_block.value = value
+        key_block.keyframe_insert('value', frame=f)
+
+
+@bpy.app.handlers.persistent
+def swap_sequence_meshes(scene, depsgraph=None):
+    """Frame change handler that gives objects from import_sequence the
+    mesh for the current frame."""
+    for ob in scene.objects:
+        names = ob.get('nds:sequence')
+        if not names:
+            continue
+        i = scene.frame_current - ob.get('nds:sequence_start', 0)
+        i = min(max(i, 0), len(names) - 1)
+        mesh = bpy.data.meshes.get(names[i])
+        if mesh is not None and ob.data != mesh:
+            ob.data = mesh
+
+
+def dump_name(filepath):
+    return strip_dump_extension(os.path.basename(filepath))
+
+
+def python_executable():
+    # Python interpreter to run worker processes with. Before 2.91,
+    # sys.executable is the Blender binary.
+    return getattr(bpy.app, 'binary_path_python', '') or sys.executable
+
+
+class Importer:
+    """Handles creating Blender objects."""
+
+    def __init__(
+        self, name, rip,
+        disk_cache=None,
+        decoded_textures=None,
+        atlas=None,
+        image_cache=None,
+        node_groups=None,
+        material_cache=None,
+        validate=True,
+        stats=None,
+        texture_jobs=0,
+    ):
+        self.name = name
+        self.rip = rip
+        self.disk_cache = disk_cache  # optional TextureDiskCache
+        self.stats = ImportStats() if stats is None else stats
+        # The parser only makes well-formed meshes, so validation can be
+        # skipped for speed
+        self.validate = validate
+        # Textures that were decoded ahead of time, by texture_cache_key
+        self.decoded_textures = decoded_textures or {}
+        # Threads to decode the rest in (see decode_textures)
+        self.texture_jobs = texture_jobs
+        self.atlas = atlas  # optional Atlas the rip was rewritten for
+
+        # Initialize caches
+        self.texture_cache = {}
+        self.index_image_cache = {}
+        self.atlas_images = {}  # by page index
+        # Keyed by pixel content. Can be shared between Importers.
+        self.image_cache = {} if image_cache is None else image_cache
+        # These can also be shared between Importers
+        self.node_groups = NodeGroups() if node_groups is None else node_groups
+        self.material_cache = {} if material_cache is None else material_cache
+        self.materials = None
+        self.toon_table = None
+
+    def create_blender_objects(self):
+        return run_steps(self.iter_create_blender_objects())
+
+    def iter_create_blender_objects(self):
+        """create_blender_objects a step at a time. Yields the fraction
+        done so far."""
+        mesh = yield from self.iter_create_mesh()
+        return self.create_object(mesh)
+
+    def create_object(self, mesh):
+        ob = bpy.data.objects.new(mesh.name, mesh)
+        bpy.context.scene.collection.objects.link(ob)
+
+        if bpy.ops.object.select_all.poll():
+            bpy.ops.object.select_all(action='DESELECT')
+        ob.select_set(True)
+        bpy.context.view_layer.objects.active = ob
+
+        return ob
+
+    def create_mesh(self):
+        return run_steps(self.iter_create_mesh())
+
+    def iter_create_mesh(self):
+        """create_mesh a step at a time. Yields the fraction done so
+        far."""
+        rip = self.rip
+        stats = self.stats
+
+        # Materials take most of the time
+        materials = yield from self.iter_get_materials()
+
+        stats.count('polygons', len(rip.faces))
+        stats.count('vertices', len(rip.verts))
+        stats.count('materials', len(rip.materials))
+
+        with stats.phase('mesh build'):
+            mesh = bpy.data.meshes.new(self.name)
+            build_mesh(mesh, rip)
+
+        if self.validate:
+            with stats.phase('validate'):
+                mesh.validate()
+
+        for material in materials:
+            mesh.materials.append(material)
+
+        yield 1.0
+        return mesh
+
+    def get_materials(self):
+        """Returns the Blender material for each of rip.materials."""
+        return run_steps(self.iter_get_materials())
+
+    def iter_get_materials(self):
+        """get_materials a step at a time, one material per step. Yields
+        the fraction done so far."""
+        if self.materials is None:
+            self.decode_textures()
+            materials = []
+            for material_args in self.rip.materials:
+                with self.stats.phase('materials'):
+                    materials.append(self.get_material(*material_args))
+                yield len(materials) / (len(self.rip.materials) + 1)
+            self.materials = materials
+        return self.materials
+
+    def decode_textures(self):
+        # Decodes all the textures that weren't decoded ahead of time at
+        # once, in parallel, before any materials are built
+        textures = [
+            texture for texture in used_textures(self.rip)
+            if texture_cache_key(*texture) not in self.decoded_textures
+        ]
+        if not textures:
+            return
+        self.decoded_textures = dict(self.decoded_textures)
+        self.decoded_textures.update(decode_textures(
+            self.rip, textures,
+            index_cache=self.index_image_cache,
+            disk_cache=self.disk_cache,
+            stats=self.stats,
+            jobs=self.texture_jobs,
+        ))
+
+    def get_texture(self, texparam, texpal):
+        # Cache on everything the texture depends on
+        cache_key = texture_cache_key(texparam, texpal)
+
+        if cache_key in self.texture_cache:
+            self.stats.count('texture cache hits')
+        else:
+            self.stats.count('texture cache misses')
+            self.texture_cache[cache_key] = self.create_texture(texparam, texpal)
+
+        return self.texture_cache[cache_key]
+
+    def create_texture(self, texparam, texpal):
+        width = 8 << ((texparam >> 20) & 7)
+        height = 8 << ((texparam >> 23) & 7)
+
+        cache_key = texture_cache_key(texparam, texpal)
+        if cache_key in self.decoded_textures:
+            # Already decoded (by decode_textures or a worker process)
+            pixels, is_opaque = self.decoded_textures[cache_key]
+        else:
+            pixels, is_opaque = decode_texture_cached(
+                self.rip, texparam, texpal,
+                index_cache=self.index_image_cache,
+                disk_cache=self.disk_cache,
+                stats=self.stats,
+            )
+
+        return self.create_image('NDS Texture', width, height, pixels, is_opaque)
+
+    def get_atlas_page(self, page_index):
+        if page_index not in self.atlas_images:
+            page = self.atlas.pages[page_index]
+            self.atlas_images[page_index] = self.create_image(
+                'NDS Atlas', page.width, page.height, page.pixels, page.is_opaque,
+            )
+        return self.atlas_images[page_index]
+
+    def create_image(self, name, width, height, pixels, is_opaque):
+        # The same texture data is often uploaded to several places in
+        # VRAM; share one image between all of them.
+        content_key = (width, height, pixels_digest(pixels))
+        if content_key in self.image_cache:
+            self.stats.count('duplicate textures')
+            return self.image_cache[content_key]
+
+        with self.stats.phase('image upload'):
+            img = bpy.data.images.new(name, width, height, alpha=not is_opaque)
+            set_image_pixels(img, pixels)
+            img.pack()
+
+        self.image_cache[content_key] = img
+        self.stats.count('unique textures')
+
+        return img
+
+    def get_toon_table(self):
+        if self.toon_table is None:
+            self.toon_table = self.create_toon_table()
+        return self.toon_table
+
+    def create_toon_table(self):
+        if np is not None:
+            c = np.array(self.rip.toon_table[:32], dtype=np.uint16)
+            pixels = np.ones((32, 4), dtype=np.float32)
+            pixels[:, 0] = c & 0x1f
+            pixels[:, 1] = (c >> 5) & 0x1f
+            pixels[:, 2] = (c >> 10) & 0x1f
+            pixels[:, :3] /= 31
+        else:
+            pixels = []
+            for i in range(32):
+                c = self.rip.toon_table[i]
+                r = c & 0x1f
+                g = (c >> 5) & 0x1f
+                b = (c >> 10) & 0x1f
+                pixels += [r/31, g/31, b/31, 1.0]
+
+        return self.create_image('NDS ToonTable', 32, 1, pixels, is_opaque=True)
+
+    def get_material(self, texparam, texpal, polygon_attr):
+        texformat = (texparam >> 26) & 7
+        blend_mode = (polygon_attr >> 4) & 0x3
+        shading = (self.rip.disp_cnt >> 1) & 1
+
+        if texformat == 0:
+            texture = None
+        elif self.atlas is not None and (texparam, texpal, polygon_attr) in self.atlas.materials:
+            texture = self.get_atlas_page(self.atlas.materials[texparam, texpal, polygon_attr])
+        else:
+            texture = self.get_texture(texparam, texpal)
+
+        is_toon = blend_mode == 2 and shading == 0
+        toon_table = self.get_toon_table() if is_toon else None
+
+        # Cache on everything the material depends on, so dumps sharing
+        # the cache (eg. the frames of a sequence) share materials too
+        cache_key = (
+            texparam,
+            polygon_attr,
+            texture.name if texture else None,
+            toon_table.name if toon_table else None,
+        )
+        if cache_key not in self.material_cache:
+            self.material_cache[cache_key] = self.create_material(
+                texparam, texpal, polygon_attr, texture, toon_table,
+            )
+        return self.material_cache[cache_key]
+
+    def create_material(self, texparam, texpal, polygon_attr, texture, toon_table):
+        mat = bpy.data.materials.new('NDS Material')
+
+        texformat = (texparam >> 26) & 7
+        blend_mode = (polygon_attr >> 4) & 0x3
+        poly_alpha = (polygon_attr >> 16) & 0x1F
+
+        if poly_alpha < 31:
+            mat.blend_method = 'BLEND'
+        elif texture and blend_mode in [0, 2]:
+            if texformat in [1, 6]:
+                # Translucent texture
+                mat.blend_method = 'BLEND'
+            elif texformat in [2, 3, 4] and (texparam & (1<<29)):
+                # Palette texture with transparent alpha0
+                mat.blend_method = 'CLIP'
+            elif texformat == 5:
+                # Compressed texture
+                mat.blend_method = 'CLIP'
+
+        mat.use_backface_culling = (polygon_attr>>6) & 1 == 0
+
+        mat.use_nodes = True
+        setup_nodetree(
+            node_tree=mat.node_tree,
+            node_groups=self.node_groups,
+            poly_alpha=poly_alpha,
+            texture=texture,
+            repeat_s=bool( (texparam>>16) & 1 ),
+            repeat_t=bool( (texparam>>17) & 1 ),
+            flip_s=bool( (texparam>>18) & 1 ),
+            flip_t=bool( (texparam>>19) & 1 ),
+            blend_mode=blend_mode,
+            toon_table=toon_table
+        )
+
+        # Useful for debugging.
+        mat['nds:TexParam'] = str(texparam)
+        mat['nds:TexPal'] = str(texpal)
+        mat['nds:PolygonAttr'] = str(polygon_attr)
+        mat['nds:Texture Format'] = str(texformat)
+        mat['nds:Polygon Mode'] = str(blend_mode)
+        mat['nds:Polygon Alpha'] = str(poly_alpha)
+        mat['nds:Polygon Back Surface'] = str((polygon_attr>>6)&1)
+        mat['nds:Polygon From Surface'] = str((polygon_attr>>7)&1)
+
+        return mat
+
+
+def build_mesh(mesh, rip):
+    """Fills an empty mesh with the rip's geometry. Much faster than
+    from_pydata, since everything is set in bulk from flat typed
+    arrays."""
+    num_verts = len(rip.verts)
+    num_faces = len(rip.faces)
+
+    if np is not None:
+        co = np.array(rip.verts, dtype=np.float32).reshape(-1)
+        loop_totals = np.fromiter(map(len, rip.faces), dtype=np.int32, count=num_faces)
+        loop_verts = np.fromiter(
+            (v for face in rip.faces for v in face),
+            dtype=np.int32,
+            count=int(loop_totals.sum()),
+        )
+        loop_starts = np.zeros(num_faces, dtype=np.int32)
+        np.cumsum(loop_totals[:-1], out=loop_starts[1:])
+        # Colors and UVs are per-vertex in the rip, but per-loop in Blender
+        colors = np.array(rip.colors, dtype=np.float32).reshape(-1, 4)[loop_verts].reshape(-1)
+        uvs = np.array(rip.uvs, dtype=np.float32).reshape(-1, 2)[loop_verts].reshape(-1)
+        face_materials = np.array(rip.face_materials, dtype=np.int32)
+    else:
+        co = array.array('f', (c for vert in rip.verts for c in vert))
+        loop_totals = array.array('i', map(len, rip.faces))
+        loop_verts = array.array('i', (v for face in rip.faces for v in face))
+        loop_starts = array.array('i', [0] * num_faces)
+        total = 0
+        for i, n in enumerate(loop_totals):
+            loop_starts[i] = total
+            total += n
+        rip_colors, rip_uvs = rip.colors, rip.uvs
+        colors = array.array('f', (c for v in loop_verts for c in rip_colors[4*v : 4*v + 4]))
+        uvs = array.array('f', (c for v in loop_verts for c in rip_uvs[2*v : 2*v + 2]))
+        face_materials = array.array('i', rip.face_materials)
+
+    mesh.vertices.add(num_verts)
+    mesh.vertices.foreach_set('co', co)
+
+    mesh.loops.add(len(loop_verts))
+    mesh.loops.foreach_set('vertex_index', loop_verts)
+
+    mesh.polygons.add(num_faces)
+    mesh.polygons.foreach_set('loop_start', loop_starts)
+    if bpy.app.version < (4, 0, 0):
+        # Read-only (computed from loop_start) since 4.0
+        mesh.polygons.foreach_set('loop_total', loop_totals)
+    mesh.polygons.foreach_set('material_index', face_materials)
+
+    mesh.update(calc_edges=True)
+
+    vertex_colors = mesh.vertex_colors.new()
+    vertex_colors.data.foreach_set('color', colors)
+
+    uv_layer = mesh.uv_layers.new()
+    uv_layer.data.foreach_set('uv', uvs)
+
+
+def set_image_pixels(img, pixels):
+    # Uploading a float32 buffer with foreach_set (Blender 2.83+) is much
+    # faster than assigning a list to img.pixels, and doesn't build one.
+    if np is not None and hasattr(img.pixels, 'foreach_set'):
+        img.pixels.foreach_set(np.asarray(pixels, dtype=np.float32).reshape(-1))
+    else:
+        img.pixels[:] = pixels
+
+
+def setup_nodetree(
+    node_tree,
+    node_groups,
+    poly_alpha,
+    texture,
+    repeat_s, repeat_t,
+    flip_s, flip_t,
+    blend_mode,
+    toon_table,
+):
+    # Will look like
+    #
+    #  [ Vertex Color ] - [NDS Shading] - [Output]
+    #                   /
+    #          [Texture]
+    #
+    # where NDS Shading is a node group (shared with every material that
+    # needs the same setup) doing the combine and transparency.
+    texture_has_alpha = texture and texture.depth == 32
+    use_texture_alpha = bool(texture_has_alpha and blend_mode in [0, 2])
+    needs_alpha = poly_alpha < 31 or use_texture_alpha
+    decal = blend_mode not in [0, 2]
+
+    # Clear existing nodes
+    while node_tree.nodes:
+        node_tree.nodes.remove(node_tree.nodes[0])
+
+    # Output node
+    output = node_tree.nodes.new(type='ShaderNodeOutputMaterial')
+    output.location = 300, 300
+
+    # Combine and transparency
+    shading = node_tree.nodes.new(type='ShaderNodeGroup')
+    shading.node_tree = node_groups.shading(
+        textured=bool(texture),
+        decal=decal,
+        needs_alpha=needs_alpha,
+        use_texture_alpha=use_texture_alpha,
+    )
+    shading.location = 80, 300
+    node_tree.links.new(output.inputs[0], shading.outputs[0])
+    if needs_alpha:
+        shading.inputs['Alpha'].default_value = poly_alpha / 31
+    socket = shading.inputs['Vertex Color']
+
+    x, y = -160, 320
+
+    if texture:
+        tex_img = texture_node(
+            node_tree=node_tree,
+            node_groups=node_groups,
+            image=texture,
+            repeat_s=repeat_s,
+            repeat_t=repeat_t,
+            flip_s=flip_s,
+            flip_t=flip_t,
+            location=(x + 50, 100),
+        )
+        node_tree.links.new(shading.inputs['Texture Color'], tex_img.outputs['Color'])
+        node_tree.links.new(shading.inputs['Texture Alpha'], tex_img.outputs['Alpha'])
+
+        x, y = x - 40, y + 60
+
+    # Toon table
+    if toon_table:
+        toon_tex = node_tree.nodes.new('ShaderNodeTexImage')
+        toon_tex.location = x - 50, y + 100
+        toon_tex.image = toon_table
+        toon_tex.interpolation = 'Closest'
+        toon_tex.extension = 'EXTEND'
+        node_tree.links.new(socket, toon_tex.outputs['Color'])
+
+        socket = toon_tex.inputs[0]
+        x -= 300
+
+    # Vertex color
+    vcolor = node_tree.nodes.new(type='ShaderNodeVertexColor')
+    vcolor.location = x, y
+    vcolor.layer_name = 'Col'
+    node_tree.links.new(socket, vcolor.outputs['Color'])
+
+
+def texture_node(node_tree, node_groups, image, repeat_s, repeat_t, flip_s, flip_t, location):
+    x, y = location
+
+    tex_img = node_tree.nodes.new('ShaderNodeTexImage')
+    tex_img.location = x - 240, y
+    tex_img.image = image
+    tex_img.interpolation = 'Closest'
+
+    x -= 360
+
+    # Wrapping
+    if not repeat_s: flip_s = False
+    if not repeat_t: flip_t = False
+    if repeat_s == repeat_t and not flip_s and not flip_t:
+        tex_img.extension = 'REPEAT' if repeat_s else 'EXTEND'
+    else:
+        # Use a node group to emulate other wrap modes
+        tex_img.extension = 'EXTEND'
+
+        wrap = node_tree.nodes.new('ShaderNodeGroup')
+        wrap.node_tree = node_groups.wrap(
+            wrap_mode(repeat_s, flip_s),
+            wrap_mode(repeat_t, flip_t),
+        )
+        wrap.location = x - 40, y - 100
+        node_tree.links.new(tex_img.inputs['Vector'], wrap.outputs[0])
+
+        # UVMap node
+        uv_map = node_tree.nodes.new('ShaderNodeUVMap')
+        uv_map.location = x - 260, y - 100
+        uv_map.uv_map = 'UVMap'
+        node_tree.links.new(wrap.inputs[0], uv_map.outputs[0])
+
+    return tex_img
+
+
+def wrap_mode(repeat, flip):
+    if not repeat:
+        return 'CLAMP'
+    return 'MIRROR' if flip else 'REPEAT'
+
+
+class NodeGroups:
+    """Creates the node groups that materials are built out of. Each
+    variant is only created once, and then shared by every material that
+    uses it, so there's less to build and fewer distinct shaders to
+    compile."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def get(self, key, create):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = create()
+        return group
+
+    def shading(self, textured, decal, needs_alpha, use_texture_alpha):
+        """Group that combines the vertex color with the texture using the
+        blend mode, and applies transparency."""
+        decal = decal and textured
+        key = ('shading', textured, decal, needs_alpha, use_texture_alpha)
+        return self.get(key, lambda: new_shading_group(*key[1:]))
+
+    def wrap(self, mode_s, mode_t):
+        """Group that wraps a UV vector with the texture's wrap modes
+        (REPEAT, MIRROR or CLAMP)."""
+        key = ('wrap', mode_s, mode_t)
+        return self.get(key, lambda: new_wrap_group(mode_s, mode_t))
+
+
+def new_shading_group(textured, decal, needs_alpha, use_texture_alpha):
+    # Will look like
+    #
+    #  [Vertex Color] - [Combine] - [Transparency] - [Output]
+    #                  /
+    #  [Texture Color]
+    #
+    name = 'NDS Decal' if decal else 'NDS Modulate' if textured else 'NDS Vertex Color'
+    if use_texture_alpha:
+        name += ' (Texture Alpha)'
+    elif needs_alpha:
+        name += ' (Alpha)'
+
+    group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+    new_group_socket(group, 'INPUT', 'NodeSocketColor', 'Vertex Color')
+    if textured:
+        new_group_socket(group, 'INPUT', 'NodeSocketColor', 'Texture Color')
+        new_group_socket(group, 'INPUT', 'NodeSocketFloat', 'Texture Alpha')
+    if needs_alpha:
+        alpha = new_group_socket(group, 'INPUT', 'NodeSocketFloat', 'Alpha')
+        alpha.default_value = 1.0
+    new_group_socket(group, 'OUTPUT', 'NodeSocketShader', 'Shader')
+
+    group_in = group.nodes.new('NodeGroupInput')
+    group_in.location = -500, 0
+    group_out = group.nodes.new('NodeGroupOutput')
+    group_out.location = 300, 0
+    socket = group_out.inputs[0]
+    x = 120
+
+    # Tranparency
+    if needs_alpha:
+        mix_transp = group.nodes.new(type='ShaderNodeMixShader')
+        mix_transp.location = x, 0
+        group.links.new(socket, mix_transp.outputs[0])
+
+        transp = group.nodes.new(type='ShaderNodeBsdfTransparent')
+        transp.location = x - 200, -200
+        group.links.new(mix_transp.inputs[1], transp.outputs[0])
+
+        if use_texture_alpha:
+            # Multiply poly_alpha and texture_alpha
+            mul_alpha = group.nodes.new(type='ShaderNodeMath')
+            mul_alpha.location = x - 200, 200
+            mul_alpha.operation = 'MULTIPLY'
+            group.links.new(mix_transp.inputs[0], mul_alpha.outputs[0])
+            group.links.new(mul_alpha.inputs[0], group_in.outputs['Texture Alpha'])
+            group.links.new(mul_alpha.inputs[1], group_in.outputs['Alpha'])
+        else:
+            group.links.new(mix_transp.inputs[0], group_in.outputs['Alpha'])
+
+        socket = mix_transp.inputs[2]
+        x -= 200
+
+    if textured:
+        # Mix node to combine vertex color and texture with the blend mode
+        mix = group.nodes.new(type='ShaderNodeMixRGB')
+        mix.location = x, 0
+        group.links.new(socket, mix.outputs[0])
+
+        if not decal:
+            # Modulate mode: vertex_color * texture_color
+            mix.label = 'Modulate'
+            mix.blend_type = 'MULTIPLY'
+            mix.inputs[0].default_value = 1
+        else:
+            # Decal mode; texture alpha is the mix factor
+            mix.label = 'Decal'
+            mix.blend_type = 'MIX'
+            group.links.new(mix.inputs[0], group_in.outputs['Texture Alpha'])
+        group.links.new(mix.inputs[2], group_in.outputs['Texture Color'])
+
+        socket = mix.inputs[1]
+
+    group.links.new(socket, group_in.outputs['Vertex Color'])
+
+    return group
+
+
+def new_wrap_group(mode_s, mode_t):
+    # Uses math nodes to emulate the wrap modes. Based on the glTF
+    # importer.
+    group = bpy.data.node_groups.new(f'NDS Wrap {mode_s} {mode_t}', 'ShaderNodeTree')
+    new_group_socket(group, 'INPUT', 'NodeSocketVector', 'Vector')
+    new_group_socket(group, 'OUTPUT', 'NodeSocketVector', 'Vector')
+
+    group_in = group.nodes.new('NodeGroupInput')
+    group_in.location = -500, 0
+    group_out = group.nodes.new('NodeGroupOutput')
+    group_out.location = 300, 0
+
+    # Separate XYZ
+    sep_uv = group.nodes.new('ShaderNodeSeparateXYZ')
+    sep_uv.location = -300, 0
+    group.links.new(sep_uv.inputs[0], group_in.outputs[0])
+
+    # Combine XYZ
+    com_uv = group.nodes.new('ShaderNodeCombineXYZ')
+    com_uv.location = 100, 0
+    group.links.new(group_out.inputs[0], com_uv.outputs[0])
+
+    for i, mode in enumerate([mode_s, mode_t]):
+        socket = sep_uv.outputs[i]
+        if mode == 'REPEAT':
+            math = group.nodes.new('ShaderNodeMath')
+            math.location = -100, 100 - i*200
+            math.operation = 'WRAP'
+            math.inputs[1].default_value = 0
+            math.inputs[2].default_value = 1
+            group.links.new(math.inputs[0], socket)
+            socket = math.outputs[0]
+        elif mode == 'MIRROR':
+            math = group.nodes.new('ShaderNodeMath')
+            math.location = -100, 100 - i*200
+            math.operation = 'PINGPONG'
+            math.inputs[1].default_value = 1
+            group.links.new(math.inputs[0], socket)
+            socket = math.outputs[0]
+        # Clamp doesn't require a node since the Texture node's extension
+        # is EXTEND.
+        group.links.new(com_uv.inputs[i], socket)
+
+    return group
+
+
+def new_group_socket(group, in_out, socket_type, name):
+    # Adds an input or output to a node group. The API for this changed
+    # in Blender 4.0.
+    if hasattr(group, 'interface'):
+        return group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+    sockets = group.inputs if in_out == 'INPUT' else group.outputs
+    return sockets.new(socket_type, name)
@@ -0,0 +1,8 @@
+"""numpy is optional everywhere; it's imported from here. Doesn't depend
+on bpy."""
+
+try:
+    # numpy ships with Blender; fall back to pure Python without it
+    import numpy as np
+except ImportError:
+    np = None
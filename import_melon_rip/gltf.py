@@ -0,0 +1,338 @@
+"""Converting parsed dumps to glTF + PNG. Doesn't depend on bpy."""
+
+import array
+import json
+import os
+import struct
+import zlib
+
+from .compat import np
+from .rip import TOON_INDEX_TABLE, le_array, load_rip, weld_vertices
+from .textures import decode_texture, pixels_digest, texture_cache_key
+
+
+# glTF constants
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+NEAREST = 9728
+REPEAT = 10497
+MIRRORED_REPEAT = 33648
+CLAMP_TO_EDGE = 33071
+
+
+def convert_dump(filepath, outpath, use_sidecar=False, use_weld=False, polygon_filter=None):
+    """Converts a .dump file to a .gltf or .glb file (by the extension of
+    outpath). Textures are written as PNGs next to it. Only the polygons
+    accepted by polygon_filter, an optional PolygonFilter, are included."""
+    rip = load_rip(filepath, use_sidecar, polygon_filter=polygon_filter)
+    if use_weld:
+        weld_vertices(rip)
+    export_gltf(rip, outpath)
+
+
+def export_gltf(rip, outpath):
+    """Writes a parsed rip as a .gltf or .glb file (by the extension of
+    outpath), plus its textures as PNGs next to it.
+
+    The materials are an approximation of what the Blender importer makes:
+    unlit, with the vertex color modulated by the texture. Decal mode is
+    treated like modulate, and toon shading is baked into the vertex
+    colors.
+    """
+    base, ext = os.path.splitext(outpath)
+    binary = ext.lower() == '.glb'
+    name = os.path.basename(base)
+
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'MelonRipper'},
+        'extensionsUsed': ['KHR_materials_unlit'],
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'name': name, 'mesh': 0}],
+        'meshes': [{'name': name, 'primitives': []}],
+        'materials': [],
+        'textures': [],
+        'images': [],
+        'samplers': [],
+        'accessors': [],
+        'bufferViews': [],
+        'buffers': [],
+    }
+    blob = bytearray()
+
+    def add_accessor(data, component_type, type, count, target, minmax=None):
+        # Appends data to the buffer and returns the index of an accessor
+        # for it
+        while len(blob) % 4 != 0:
+            blob.append(0)
+        gltf['bufferViews'].append({
+            'buffer': 0,
+            'byteOffset': len(blob),
+            'byteLength': len(data),
+            'target': target,
+        })
+        blob.extend(data)
+        accessor = {
+            'bufferView': len(gltf['bufferViews']) - 1,
+            'componentType': component_type,
+            'type': type,
+            'count': count,
+        }
+        if minmax:
+            accessor['min'], accessor['max'] = minmax
+        gltf['accessors'].append(accessor)
+        return len(gltf['accessors']) - 1
+
+    # Vertex data, shared by all the primitives
+
+    num_verts = len(rip.verts)
+
+    # Blender is Z-up; glTF is Y-up like the DS
+    positions = []
+    for x, y, z in rip.verts:
+        positions += [x, z, -y]
+    minmax = None
+    if num_verts:
+        # Bounds have to match the stored float32 values exactly
+        positions = array.array('f', positions).tolist()
+        minmax = (
+            [min(positions[i::3]) for i in range(3)],
+            [max(positions[i::3]) for i in range(3)],
+        )
+
+    colors = bake_toon_colors(rip)
+
+    # Blender flips textures vertically; glTF doesn't
+    uvs = list(rip.uvs)
+    uvs[1::2] = [1 - v for v in uvs[1::2]]
+
+    attributes = None
+    if num_verts:
+        attributes = {
+            'POSITION': add_accessor(le_array('f', positions), FLOAT, 'VEC3', num_verts, ARRAY_BUFFER, minmax),
+            'COLOR_0': add_accessor(le_array('f', colors), FLOAT, 'VEC4', num_verts, ARRAY_BUFFER),
+            'TEXCOORD_0': add_accessor(le_array('f', uvs), FLOAT, 'VEC2', num_verts, ARRAY_BUFFER),
+        }
+
+    # One primitive per material, triangulating quads
+
+    indices = [[] for _ in rip.materials]
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        tris = indices[material_index]
+        for i in range(1, len(face) - 1):
+            tris += [face[0], face[i], face[i + 1]]
+
+    # texture_cache_key leaves out the repeat/flip bits, so the same
+    # texels can be drawn with several samplers
+    source_indices = {}  # image index by texture_cache_key
+    image_indices = {}  # by pixel content
+    sampler_indices = {}  # by repeat/flip bits
+    texture_indices = {}  # by (image index, repeat/flip bits)
+    index_cache = {}
+
+    for material_index, (texparam, texpal, polygon_attr) in enumerate(rip.materials):
+        texformat = (texparam >> 26) & 7
+        texture = None
+        if texformat != 0:
+            cache_key = texture_cache_key(texparam, texpal)
+            if cache_key not in source_indices:
+                pixels, is_opaque = decode_texture(rip, texparam, texpal, index_cache)
+                width = 8 << ((texparam >> 20) & 7)
+                height = 8 << ((texparam >> 23) & 7)
+
+                content_key = (width, height, pixels_digest(pixels))
+                if content_key not in image_indices:
+                    png_name = '%s_%d.png' % (name, len(gltf['images']))
+                    write_png(
+                        os.path.join(os.path.dirname(outpath), png_name),
+                        width, height, pixels_to_rgba8(pixels, width, height),
+                    )
+                    gltf['images'].append({'uri': png_name})
+                    image_indices[content_key] = len(gltf['images']) - 1
+                source_indices[cache_key] = image_indices[content_key]
+
+            wrap = (texparam >> 16) & 0xF
+            if wrap not in sampler_indices:
+                gltf['samplers'].append({
+                    'magFilter': NEAREST,
+                    'minFilter': NEAREST,
+                    'wrapS': wrap_mode(texparam >> 16, texparam >> 18),
+                    'wrapT': wrap_mode(texparam >> 17, texparam >> 19),
+                })
+                sampler_indices[wrap] = len(gltf['samplers']) - 1
+
+            texture_key = (source_indices[cache_key], wrap)
+            if texture_key not in texture_indices:
+                gltf['textures'].append({
+                    'source': source_indices[cache_key],
+                    'sampler': sampler_indices[wrap],
+                })
+                texture_indices[texture_key] = len(gltf['textures']) - 1
+
+            texture = texture_indices[texture_key]
+
+        gltf['materials'].append(gltf_material(texparam, polygon_attr, texture))
+
+        tris = indices[material_index]
+        if not tris:
+            continue
+        gltf['meshes'][0]['primitives'].append({
+            'attributes': attributes,
+            'indices': add_accessor(le_array('I', tris), UNSIGNED_INT, 'SCALAR', len(tris), ELEMENT_ARRAY_BUFFER),
+            'material': material_index,
+        })
+
+    if not gltf['meshes'][0]['primitives']:
+        # No polygons (eg. all filtered out). A mesh needs at least one
+        # primitive, so leave just an empty node, without the vertex data.
+        del gltf['meshes'], gltf['nodes'][0]['mesh']
+        del gltf['accessors'], gltf['bufferViews'], gltf['buffers']
+        blob = None
+
+    # Drop empty arrays; glTF doesn't allow them
+    for key in ['materials', 'textures', 'images', 'samplers']:
+        if not gltf[key]:
+            del gltf[key]
+    if 'materials' not in gltf:
+        del gltf['extensionsUsed']
+
+    if binary:
+        if blob is not None:
+            gltf['buffers'].append({'byteLength': len(blob)})
+        write_glb(outpath, gltf, None if blob is None else bytes(blob))
+    else:
+        if blob is not None:
+            bin_name = name + '.bin'
+            gltf['buffers'].append({'uri': bin_name, 'byteLength': len(blob)})
+            with open(os.path.join(os.path.dirname(outpath), bin_name), 'wb') as f:
+                f.write(blob)
+        with open(outpath, 'w') as f:
+            json.dump(gltf, f, indent=1)
+
+
+def gltf_material(texparam, polygon_attr, texture):
+    # Same logic as Importer.create_material
+    texformat = (texparam >> 26) & 7
+    blend_mode = (polygon_attr >> 4) & 0x3
+    poly_alpha = (polygon_attr >> 16) & 0x1F
+
+    pbr = {
+        'baseColorFactor': [1, 1, 1, poly_alpha / 31],
+        'metallicFactor': 0,
+        'roughnessFactor': 1,
+    }
+    if texture is not None:
+        pbr['baseColorTexture'] = {'index': texture}
+
+    material = {
+        'pbrMetallicRoughness': pbr,
+        'doubleSided': (polygon_attr>>6) & 1 == 1,
+        'extensions': {'KHR_materials_unlit': {}},
+        'extras': {
+            'nds:TexParam': texparam,
+            'nds:PolygonAttr': polygon_attr,
+        },
+    }
+
+    if poly_alpha < 31:
+        material['alphaMode'] = 'BLEND'
+    elif texture is not None and blend_mode in [0, 2]:
+        if texformat in [1, 6]:
+            # Translucent texture
+            material['alphaMode'] = 'BLEND'
+        elif texformat in [2, 3, 4] and (texparam & (1<<29)):
+            # Palette texture with transparent alpha0
+            material['alphaMode'] = 'MASK'
+        elif texformat == 5:
+            # Compressed texture
+            material['alphaMode'] = 'MASK'
+
+    return material
+
+
+def wrap_mode(repeat, flip):
+    if not repeat & 1:
+        return CLAMP_TO_EDGE
+    return MIRRORED_REPEAT if flip & 1 else REPEAT
+
+
+def bake_toon_colors(rip):
+    """Returns rip.colors with the toon table applied to the vertices of
+    toon-shaded polygons."""
+    colors = list(rip.colors)
+    if (rip.disp_cnt >> 1) & 1:
+        return colors  # highlight mode; nothing to bake
+
+    # For toon polygons, the colors are TOON_INDEX_TABLE[n]/255 where n
+    # is the toon table index
+    table_index = {TOON_INDEX_TABLE[n]: n for n in range(32)}
+    toon = []
+    for c in rip.toon_table:
+        toon.append([(c & 0x1f)/31, ((c >> 5) & 0x1f)/31, ((c >> 10) & 0x1f)/31, 1.0])
+
+    materials = list(rip.materials)
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        polygon_attr = materials[material_index][2]
+        if (polygon_attr >> 4) & 3 != 2:
+            continue
+        for v in face:
+            # Read the unbaked color; welded vertices can be shared with
+            # a face that's already been baked
+            n = table_index[round(rip.colors[4*v] * 255)]
+            colors[4*v : 4*v + 4] = toon[n]
+
+    return colors
+
+
+def pixels_to_rgba8(pixels, width, height):
+    # Converts pixels from decode_texture to 8-bit RGBA, top row first
+    if np is not None:
+        rgba = np.rint(np.asarray(pixels, dtype=np.float32) * 255).astype(np.uint8)
+        return rgba.reshape(height, width * 4)[::-1].tobytes()
+
+    rgba = bytes(round(p * 255) for p in pixels)
+    stride = width * 4
+    return b''.join(
+        rgba[y*stride : (y+1)*stride]
+        for y in reversed(range(height))
+    )
+
+
+def write_png(path, width, height, rgba):
+    # Writes 8-bit RGBA data (top row first) to a PNG file
+    def chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', crc)
+
+    stride = width * 4
+    raw = b''.join(
+        b'\0' + rgba[y*stride : (y+1)*stride]  # filter type None
+        for y in range(height)
+    )
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw, 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def write_glb(path, gltf, blob):
+    # blob is None for a file without a BIN chunk
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+
+    length = 12 + 8 + len(json_chunk)
+    if blob is not None:
+        blob += b'\0' * (-len(blob) % 4)
+        length += 8 + len(blob)
+
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4sII', b'glTF', 2, length))
+        f.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+        f.write(json_chunk)
+        if blob is not None:
+            f.write(struct.pack('<I4s', len(blob), b'BIN\0'))
+            f.write(blob)
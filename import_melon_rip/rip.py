@@ -0,0 +1,987 @@
+"""Parsing for MelonRipper .dump files. Doesn't depend on bpy."""
+
+import array
+import gzip
+import hashlib
+import lzma
+import mmap
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+from .compat import np
+from .stats import ImportStats
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    zstd = None
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+
+class ShowErrorMsg(RuntimeError):
+    # Raise to show an error message
+    pass
+
+
+# Precomputed table used for toon mode.
+# TOON_INDEX_TABLE[n]/255 is a color that will pick the nth texel
+# when used as the UV for a 32x1 texture.
+TOON_INDEX_TABLE = [
+    24,  60,  78,  93,  105, 115, 124, 132,
+    140, 148, 155, 161, 167, 173, 179, 185,
+    190, 195, 200, 205, 209, 214, 218, 222,
+    226, 230, 234, 238, 242, 246, 249, 253,
+]
+
+
+def load_rip(filepath, use_sidecar=False, stats=None, polygon_filter=None):
+    """Returns a fully parsed Rip for a .dump file.
+
+    With use_sidecar, the parsed result is cached in a .ripcache file next
+    to the dump and reused while the dump is unchanged. Timings and
+    counters are recorded in stats, an optional ImportStats. Only the
+    polygons accepted by polygon_filter, an optional PolygonFilter, are
+    parsed.
+    """
+    if stats is None:
+        stats = ImportStats()
+
+    if polygon_filter is not None:
+        # The sidecar holds the whole dump, so it's no use here
+        use_sidecar = False
+
+    sidecar_path = filepath + SIDECAR_EXT
+    st = os.stat(filepath)
+
+    if use_sidecar:
+        with stats.phase('load sidecar'):
+            rip = load_sidecar(sidecar_path, filepath, st)
+        if rip is not None:
+            stats.count('sidecar hits')
+            return rip
+        stats.count('sidecar misses')
+
+    rip = Rip(load_dump(filepath), polygon_filter)
+    try:
+        rip.parse(stats)
+        if polygon_filter is not None:
+            stats.count('filtered polygons', rip.index.num_polygons - len(rip.faces))
+        if use_sidecar:
+            with stats.phase('save sidecar'):
+                digest = hashlib.blake2b(rip.dump, digest_size=16).digest()
+                save_sidecar(rip, sidecar_path, st, digest)
+    finally:
+        # Everything we need has been copied out of the dump
+        rip.release()
+
+    return rip
+
+
+# Dumps can also be compressed with gzip, xz or zstd (zstd needs Python
+# 3.14 or the zstandard module)
+DUMP_EXTENSIONS = ['.dump', '.dump.gz', '.dump.xz', '.dump.zst']
+
+
+def is_dump_path(path):
+    return path.endswith(tuple(DUMP_EXTENSIONS))
+
+
+def strip_dump_extension(name):
+    for ext in sorted(DUMP_EXTENSIONS, key=len, reverse=True):
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
+def load_dump(filepath, use_mmap=True):
+    """Returns the contents of a .dump file as a buffer.
+
+    By default the file is memory-mapped, so only the pages that parsing
+    actually touches get read, and nothing is copied up front. Close the
+    buffer (see Rip.release) when done with it.
+
+    Compressed dumps (.dump.gz etc.) are decompressed into memory as they
+    are read, without a temporary file.
+    """
+    if filepath.endswith(('.gz', '.xz', '.zst')):
+        return read_compressed(filepath)
+
+    with open(filepath, 'rb') as f:
+        if use_mmap:
+            try:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files can't be mapped, and some filesystems
+                # don't support it; just read those.
+                pass
+        return f.read()
+
+
+def weld_vertices(rip):
+    """Merges vertices with the same position, color, UV and material,
+    rebuilding the connectivity that's lost by every polygon having its
+    own vertices. Faces that collapse to less than three distinct
+    vertices are dropped. Returns the number of vertices removed.
+
+    Vertices are matched exactly, by hashing their attributes; there's no
+    distance threshold.
+    """
+    verts, colors, uvs = rip.verts, rip.colors, rip.uvs
+    num_verts = len(verts)
+
+    vert_materials = [0] * num_verts
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        for v in face:
+            vert_materials[v] = material_index
+
+    if np is not None and num_verts:
+        key_dtype = np.dtype([
+            ('pos', '<f8', 3),
+            ('color', '<f8', 4),
+            ('uv', '<f8', 2),
+            ('material', '<i4'),
+        ])
+        keys = np.empty(num_verts, dtype=key_dtype)
+        # Adding 0.0 turns -0.0 into 0.0, so they hash the same
+        keys['pos'] = np.array(verts, dtype=np.float64) + 0.0
+        keys['color'] = np.array(colors, dtype=np.float64).reshape(-1, 4) + 0.0
+        keys['uv'] = np.array(uvs, dtype=np.float64).reshape(-1, 2) + 0.0
+        keys['material'] = vert_materials
+        keys = keys.view(np.dtype((np.void, key_dtype.itemsize)))
+
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # Keep the welded vertices in order of first use
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        new_index = rank[inverse.reshape(-1)].tolist()
+        kept = first[order].tolist()
+
+    else:
+        index = {}
+        new_index = []
+        kept = []
+        for v in range(num_verts):
+            key = (
+                verts[v],
+                tuple(colors[4*v : 4*v + 4]),
+                tuple(uvs[2*v : 2*v + 2]),
+                vert_materials[v],
+            )
+            i = index.setdefault(key, len(index))
+            if i == len(kept):
+                kept.append(v)
+            new_index.append(i)
+
+    faces = []
+    face_materials = []
+    for face, material_index in zip(rip.faces, rip.face_materials):
+        face = tuple(dict.fromkeys(new_index[v] for v in face))
+        if len(face) >= 3:
+            faces.append(face)
+            face_materials.append(material_index)
+
+    rip.verts = [verts[v] for v in kept]
+    rip.colors = [c for v in kept for c in colors[4*v : 4*v + 4]]
+    rip.uvs = [c for v in kept for c in uvs[2*v : 2*v + 2]]
+    rip.faces = faces
+    rip.face_materials = face_materials
+
+    return num_verts - len(kept)
+
+
+# gzip raises BadGzipFile, an OSError
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, zlib.error)
+if zstd is not None:
+    DECOMPRESSION_ERRORS += (zstd.ZstdError,)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+def read_compressed(filepath):
+    # Returns the decompressed contents of a .gz, .xz or .zst file
+    name = os.path.basename(filepath)
+    try:
+        if filepath.endswith('.gz'):
+            with gzip.open(filepath, 'rb') as f:
+                return read_stream(f)
+        if filepath.endswith('.xz'):
+            with lzma.open(filepath, 'rb') as f:
+                return read_stream(f)
+        if zstd is not None:
+            with zstd.open(filepath, 'rb') as f:
+                return read_stream(f)
+        if zstandard is not None:
+            with open(filepath, 'rb') as raw:
+                with zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                    return read_stream(f)
+    except DECOMPRESSION_ERRORS as e:
+        raise ShowErrorMsg(f"Couldn't decompress {name}: {e}")
+
+    raise ShowErrorMsg(f"Reading {name} needs the zstandard module")
+
+
+def read_stream(f):
+    # Reads a file object to the end, a chunk at a time, into one
+    # bytearray. Avoids the list of chunks read() would join at the end.
+    data = bytearray()
+    while True:
+        chunk = f.read(1 << 20)
+        if not chunk:
+            return data
+        data += chunk
+
+
+class Rip:
+    """Handles parsing .dump file.
+
+    Parsing happens in two passes. scan() makes a quick pass over the
+    opcodes and records where everything is in a DumpIndex. Then the
+    geometry, VRAM and render state sections are each decoded from the
+    index the first time one of their attributes is accessed (or all at
+    once by parse()).
+    """
+
+    # Attributes that are materialized on first access, and the section
+    # they belong to. Section foo is loaded by the method parse_foo.
+    LAZY_ATTRS = {
+        'verts': 'geometry',
+        'colors': 'geometry',
+        'uvs': 'geometry',
+        'faces': 'geometry',
+        'face_materials': 'geometry',
+        'materials': 'geometry',
+        'vram_map_texture': 'vram',
+        'vram_map_texpal': 'vram',
+        'vram_tex': 'vram',
+        'vram_pal_bytes': 'vram',
+        'vram_pal': 'vram',
+        'vram_pal_array': 'vram',
+        'disp_cnt': 'render_state',
+        'toon_table': 'render_state',
+    }
+
+    def __init__(self, dump, polygon_filter=None):
+        self.dump = dump
+        self.polygon_filter = polygon_filter
+        self.index = None
+        self.loaded = set()  # sections already parsed
+
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet
+        section = Rip.LAZY_ATTRS.get(name)
+        if section is None or section in self.loaded:
+            raise AttributeError(name)
+        getattr(self, 'parse_' + section)()
+        return getattr(self, name)
+
+    def __getstate__(self):
+        # The palette views can't be pickled (eg. to send the Rip back
+        # from a worker process); they're remade from vram_pal_bytes.
+        state = dict(self.__dict__)
+        state.pop('vram_pal', None)
+        state.pop('vram_pal_array', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'vram_pal_bytes' in state:
+            self.set_vram(self.vram_tex, self.vram_pal_bytes)
+
+    def check_magic(self):
+        magic = self.dump[:24]
+        magic = magic.rstrip(b'\0')
+        prefix = b'melon ripper v'
+        if not magic.startswith(prefix):
+            raise ShowErrorMsg('Not a MelonRipper file')
+
+        version = magic[len(prefix):]  # remove prefix
+        try:
+            version = int(str(version, encoding='ascii'))
+        except ValueError:
+            raise ShowErrorMsg('Weird magic in MelonRipper file')
+
+        min_version = 1
+        max_version = 2
+        if version < min_version:
+            raise ShowErrorMsg(
+                'MelonRipper file too old; '
+                'version is %d; must be at least %d' % (version, min_version))
+        if version > max_version:
+            raise ShowErrorMsg(
+                'MelonRipper file too new, update this addon! '
+                'Version is %d; I only support %d' % (version, max_version)
+            )
+
+    def parse(self, stats=None):
+        """Parses all sections of the dump up front."""
+        if stats is None:
+            stats = ImportStats()
+        with stats.phase('parse'):
+            self.scan()
+            self.parse_render_state()
+            self.parse_geometry()
+        with stats.phase('vram setup'):
+            self.parse_vram()
+
+    def release(self):
+        """Drops the raw dump (closing it if it's memory-mapped). Sections
+        that haven't been parsed yet can't be loaded after this."""
+        if self.dump is None:
+            return
+        if isinstance(self.dump, mmap.mmap):
+            self.dump.close()
+        self.dump = None
+
+    def scan(self):
+        """First pass. Returns a DumpIndex of the opcode offsets without
+        decoding any polygons."""
+        if self.index is not None:
+            return self.index
+
+        self.check_magic()
+
+        index = DumpIndex()
+        pos = 24  # end of magic
+
+        texparam = 0
+        texpal = 0
+        polygon_attr = 0
+
+        dump = self.dump
+        while pos < len(dump):
+            op = dump[pos:pos+4]
+
+            if op in [b"TRI ", b"QUAD"]:
+                nverts = 3 if op == b"TRI " else 4
+                record_size = 4 + VERTEX_SIZE*nverts
+
+                # Extend run over all following records of the same size
+                start = pos
+                while dump[pos:pos+4] == op:
+                    if pos + record_size > len(dump):
+                        raise RuntimeError('truncated MelonRipper file')
+                    pos += record_size
+
+                index.polygon_runs.append(PolygonRun(
+                    offset=start,
+                    count=(pos - start) // record_size,
+                    nverts=nverts,
+                    texparam=texparam,
+                    texpal=texpal,
+                    polygon_attr=polygon_attr,
+                ))
+                continue
+
+            pos += 4
+
+            if op in [b"TPRM", b"TPLT", b"PATR"]:
+                value, = struct.unpack_from('<I', dump, offset=pos)
+                index.state_changes.append((pos - 4, op, value))
+                pos += 4
+
+                if op == b"TPRM": texparam = value
+                elif op == b"TPLT": texpal = value
+                else: polygon_attr = value
+
+            elif op == b"VRAM":
+                index.vram_offset = pos
+                pos += 4*4 + 4*8 + 4*(128 << 10) + 6*(16 << 10)
+
+            elif op == b"DISP":
+                index.disp_offset = pos
+                pos += 4
+
+            elif op == b"TOON":
+                index.toon_offset = pos
+                pos += 2*32
+
+            else:
+                raise RuntimeError('unknown opcode in MelonRipper file')
+
+        self.index = index
+        return index
+
+    def parse_render_state(self):
+        self.loaded.add('render_state')
+        index = self.scan()
+
+        # Default value for stuff missing from older versions of .dump
+        # files; initialize for backwards compatiblity.
+        self.disp_cnt = 0
+        self.toon_table = [0xFFFF] * 32
+
+        if index.disp_offset is not None:
+            self.disp_cnt, = struct.unpack_from('<I', self.dump, offset=index.disp_offset)
+
+        if index.toon_offset is not None:
+            self.toon_table = struct.unpack_from('<32H', self.dump, offset=index.toon_offset)
+
+    def parse_vram(self):
+        self.loaded.add('vram')
+        index = self.scan()
+
+        if index.vram_offset is None:
+            return
+
+        dump = self.dump
+        pos = index.vram_offset
+
+        self.vram_map_texture = struct.unpack_from('<4I', dump, offset=pos)
+        pos += 4*4
+
+        self.vram_map_texpal = struct.unpack_from('<8I', dump, offset=pos)
+        pos += 4*8
+
+        # Reference the banks in place; load_vram copies them only once,
+        # into their place in VRAM.
+        with memoryview(dump) as view:
+            banks = []
+
+            # Banks A-D, 128K each
+            for _ in range(4):
+                banks.append(view[pos : pos + (128 << 10)])
+                pos += 128 << 10
+
+            # Banks E-G, E is 64K, F-G are 16K
+            for _ in range(6):
+                banks.append(view[pos : pos + (16 << 10)])
+                pos += 16 << 10
+
+            self.load_vram(banks)
+
+            for bank in banks:
+                bank.release()
+
+    def parse_geometry(self):
+        self.loaded.add('geometry')
+
+        verts = []
+        colors = []
+        uvs = []
+        faces = []
+        face_materials = []
+        materials = {}
+
+        bounds_filter = self.polygon_filter
+        if bounds_filter is not None and bounds_filter.bounds is None:
+            bounds_filter = None
+
+        for run in self.imported_runs():
+            # Decode the whole run at once, straight into the lists
+            vert_index = len(verts)
+            count = run.count
+            if bounds_filter is None:
+                self.decode_polygons(run, 0, count, verts, colors, uvs)
+            else:
+                count, run_verts, run_colors, run_uvs = bounds_filter.keep_in_bounds(
+                    run.nverts, *self.decode_polygons(run, 0, count),
+                )
+                if not count:
+                    continue
+                verts += run_verts
+                colors += run_colors
+                uvs += run_uvs
+
+            material_args = (run.texparam, run.texpal, run.polygon_attr)
+            if material_args not in materials:
+                materials[material_args] = len(materials)
+            material_index = materials[material_args]
+
+            faces += polygon_faces(vert_index, count, run.nverts)
+            face_materials += [material_index] * count
+
+        self.verts = verts
+        self.colors = self.finalize_colors(colors)
+        self.uvs = uvs
+        self.faces = faces
+        self.face_materials = face_materials
+        self.materials = materials
+
+    def imported_runs(self):
+        # Generates the PolygonRuns to import: everything but shadow
+        # volumes and runs the polygon_filter rejects
+        polygon_filter = self.polygon_filter
+        for run in self.scan().polygon_runs:
+            if (run.polygon_attr >> 4) & 3 == 3:
+                # Skip shadow volumes; no idea what to do with these
+                continue
+            if polygon_filter is not None and not polygon_filter.accepts_run(run):
+                continue  # without decoding it
+            yield run
+
+    def iter_polygons(self, batch_size=4096):
+        """Generates the polygons in draw order as PolygonBatches of at
+        most batch_size polygons, skipping shadow volumes and anything
+        rejected by the polygon_filter.
+
+        Only one batch is decoded at a time, so memory use is bounded by
+        the batch size rather than the size of the dump. This is for
+        callers that can work a batch at a time (eg. external tools);
+        parse_geometry decodes whole runs, which is faster, and the
+        Importer works on the parsed Rip.
+        """
+        polygon_filter = self.polygon_filter
+
+        first_vert = 0
+        for run in self.imported_runs():
+            for start in range(0, run.count, batch_size):
+                count = min(batch_size, run.count - start)
+                verts, colors, uvs = self.decode_polygons(run, start, count)
+                if polygon_filter is not None and polygon_filter.bounds is not None:
+                    count, verts, colors, uvs = polygon_filter.keep_in_bounds(
+                        run.nverts, verts, colors, uvs,
+                    )
+                    if not count:
+                        continue
+                yield PolygonBatch(
+                    run=run,
+                    count=count,
+                    first_vert=first_vert,
+                    verts=verts,
+                    colors=self.finalize_colors(colors),
+                    uvs=uvs,
+                )
+                first_vert += len(verts)
+
+    def decode_polygons(self, run, start, count, verts=None, colors=None, uvs=None):
+        # Decodes count polygons of a PolygonRun, starting from the start-th.
+        # They're appended to verts, colors and uvs (new lists if not
+        # given), which are returned; colors still need finalize_colors.
+        if verts is None:
+            verts, colors, uvs = [], [], []
+
+        dump = self.dump
+        nverts = run.nverts
+        texparam = run.texparam
+        blend_mode = (run.polygon_attr >> 4) & 3
+        texture_width = 8 << ((texparam >> 20) & 7)
+        texture_height = 8 << ((texparam >> 23) & 7)
+
+        if np is not None and count >= MIN_NUMPY_RUN:
+            # Fast path: decode them all at once.
+            v = polygon_run_array(dump, run, start, count)['verts'].reshape(-1)
+
+            xyz = v['pos'] * 2**-12  # fixed point to float
+            xyz = np.stack([xyz[:, 0], -xyz[:, 2], xyz[:, 1]], axis=1)
+            verts += map(tuple, xyz.tolist())  # switch Yup2Zup
+
+            rgb = (v['color'].astype(np.int64) - 0xFFF) >> 12
+            tmp_colors = np.empty((len(v), 4), dtype=np.int64)
+            tmp_colors[:, :3] = rgb
+            tmp_colors[:, 3] = (blend_mode == 2)
+            colors += tmp_colors.ravel().tolist()
+
+            st = v['texcoord'].astype(np.float64)
+            st[:, 0] = st[:, 0]/16/texture_width
+            st[:, 1] = 1 - st[:, 1]/16/texture_height
+            uvs += st.ravel().tolist()
+
+            return verts, colors, uvs
+
+        pos = run.offset + start * (4 + VERTEX_SIZE*nverts)
+        for _ in range(count):
+            pos += 4  # skip opcode
+
+            for _ in range(nverts):
+                x, y, z = struct.unpack_from('<3i', dump, offset=pos)
+                pos += 4*3
+                x *= 2**-12 ; y *= 2**-12 ; z *= 2**-12  # fixed point to float
+                verts.append((x, -z, y))  # switch Yup2Zup
+
+                r, g, b = struct.unpack_from('<3i', dump, offset=pos)
+                pos += 4*3
+                # Get back to 0-31 range (undo melonDS transform)
+                r = (r - 0xFFF) >> 12
+                g = (g - 0xFFF) >> 12
+                b = (b - 0xFFF) >> 12
+                colors += [r, g, b]
+                # The final vertex color is affected by whether
+                # toon/highlight mode is enabled in disp_cnt, so
+                # remember this so finalize_colors can compute the
+                # final color.
+                use_toon_highlight = (blend_mode == 2)
+                colors.append(use_toon_highlight)
+
+                s, t = struct.unpack_from('<2h', dump, offset=pos)
+                pos += 2*2
+                # Textures are upside down in Blender, so we flip them,
+                # but that means we need to flip the T coord too.
+                uvs += [s/16/texture_width, 1 - t/16/texture_height]
+
+        return verts, colors, uvs
+
+    def finalize_colors(self, tmp):
+        colors = []
+        is_highlight = ((self.disp_cnt>>1) & 1) == 1
+
+        for i in range(0, len(tmp), 4):
+            r, g, b, is_toon_highlight = tmp[i:i+4]
+
+            if not is_toon_highlight:
+                # Normal color
+                colors += [r/31, g/31, b/31, 1.0]
+
+            elif is_highlight:
+                # Highlight mode
+                colors += [r/31, r/31, r/31, 1.0]
+
+            else:
+                # Toon mode
+                c = TOON_INDEX_TABLE[r] / 255
+                colors += [c, c, c, 1.0]
+
+        return colors
+
+    def load_vram(self, banks):
+        # Use the memory map to compute how banks are laid out in VRAM.
+        # Each mapped bank is copied straight into place; unmapped slots
+        # are left zeroed. The buffers are allocated zero-filled, so the
+        # pages of slots nothing is copied into are never touched.
+        vram_tex = bytearray(4 * (128 << 10))
+        vram_pal = bytearray(8 * (16 << 10))
+
+        for i in range(4):
+            mask = self.vram_map_texture[i]
+            slot = slice(i * (128 << 10), (i + 1) * (128 << 10))
+            if mask & (1 << 0): vram_tex[slot] = banks[0]
+            elif mask & (1 << 1): vram_tex[slot] = banks[1]
+            elif mask & (1 << 2): vram_tex[slot] = banks[2]
+            elif mask & (1 << 3): vram_tex[slot] = banks[3]
+
+        for i in range(8):
+            mask = self.vram_map_texpal[i]
+            slot = slice(i * (16 << 10), (i + 1) * (16 << 10))
+            if mask & (1 << 4): vram_pal[slot] = banks[4 + (i & 3)]
+            elif mask & (1 << 5): vram_pal[slot] = banks[8]
+            elif mask & (1 << 6): vram_pal[slot] = banks[9]
+
+        self.set_vram(vram_tex, vram_pal)
+
+    def set_vram(self, vram_tex, vram_pal):
+        # Sets the texture and palette VRAM from their raw bytes. Nothing
+        # is decoded up front: vram_tex is indexed as bytes, and vram_pal
+        # is a view of the palette bytes as u16s.
+        self.vram_tex = vram_tex
+        self.vram_pal_bytes = vram_pal
+        self.vram_pal = le_u16_view(vram_pal)
+
+        if np is not None:
+            # Same thing as an array, for the numpy texture decoders
+            self.vram_pal_array = np.frombuffer(vram_pal, dtype='<u2')
+
+
+# Sidecar files cache a parsed Rip next to its .dump file. The format is
+# a header (magic, version, and the size, mtime and hash of the dump it
+# was made from) followed by a zlib-compressed body of length-prefixed
+# little-endian arrays; see save_sidecar for the order.
+SIDECAR_EXT = '.ripcache'
+SIDECAR_MAGIC = b'MELONRIP-SIDECAR'
+SIDECAR_VERSION = 1
+SIDECAR_HEADER = struct.Struct('<16sIQq16s')
+
+
+def save_sidecar(rip, path, st, digest):
+    """Saves a parsed rip to a sidecar file. st and digest are the
+    os.stat and content hash of the dump it was parsed from."""
+    vram_map = []
+    if hasattr(rip, 'vram_tex'):  # dump may not have a VRAM block
+        vram_map = list(rip.vram_map_texture) + list(rip.vram_map_texpal)
+
+    sections = [
+        le_array('d', [c for v in rip.verts for c in v]),
+        le_array('d', rip.colors),
+        le_array('d', rip.uvs),
+        bytes(len(face) for face in rip.faces),
+        le_array('I', rip.face_materials),
+        le_array('I', [arg for args in rip.materials for arg in args]),
+        le_array('I', [rip.disp_cnt] + list(rip.toon_table)),
+        le_array('I', vram_map),
+        bytes(rip.vram_tex) if vram_map else b'',
+        bytes(rip.vram_pal_bytes) if vram_map else b'',
+    ]
+    body = b''.join(struct.pack('<I', len(sec)) + sec for sec in sections)
+    header = SIDECAR_HEADER.pack(
+        SIDECAR_MAGIC, SIDECAR_VERSION, st.st_size, st.st_mtime_ns, digest,
+    )
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(zlib.compress(body, 1))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Couldn't write {path}: {e}")
+
+
+def load_sidecar(path, dump_path, st):
+    """Returns the Rip saved in a sidecar file, or None if there isn't
+    one or it doesn't match the dump (whose os.stat is st)."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(SIDECAR_HEADER.size)
+            if len(header) != SIDECAR_HEADER.size:
+                return None
+            magic, version, size, mtime_ns, digest = SIDECAR_HEADER.unpack(header)
+            if (magic, version) != (SIDECAR_MAGIC, SIDECAR_VERSION):
+                return None
+            if (size, mtime_ns) != (st.st_size, st.st_mtime_ns):
+                return None
+
+            dump = load_dump(dump_path)
+            try:
+                if hashlib.blake2b(dump, digest_size=16).digest() != digest:
+                    return None
+            finally:
+                if isinstance(dump, mmap.mmap):
+                    dump.close()
+
+            body = zlib.decompress(f.read())
+    except (OSError, zlib.error):
+        return None
+
+    sections = []
+    pos = 0
+    while pos < len(body):
+        n, = struct.unpack_from('<I', body, pos)
+        sections.append(body[pos + 4 : pos + 4 + n])
+        pos += 4 + n
+
+    (verts, colors, uvs, face_sizes, face_materials, materials,
+        render_state, vram_map, vram_tex, vram_pal) = sections
+
+    rip = Rip(None)
+    rip.loaded.update(['render_state', 'vram', 'geometry'])
+
+    verts = iter(from_le_array('d', verts))
+    rip.verts = list(zip(verts, verts, verts))
+    rip.colors = from_le_array('d', colors)
+    rip.uvs = from_le_array('d', uvs)
+    # Each face owns consecutive verts
+    rip.faces = []
+    vert_index = 0
+    for nverts in face_sizes:
+        rip.faces.append(tuple(range(vert_index, vert_index + nverts)))
+        vert_index += nverts
+    rip.face_materials = from_le_array('I', face_materials)
+    materials = iter(from_le_array('I', materials))
+    rip.materials = {args: i for i, args in enumerate(zip(materials, materials, materials))}
+
+    render_state = from_le_array('I', render_state)
+    rip.disp_cnt = render_state[0]
+    rip.toon_table = tuple(render_state[1:])
+
+    if vram_map:
+        vram_map = from_le_array('I', vram_map)
+        rip.vram_map_texture = tuple(vram_map[:4])
+        rip.vram_map_texpal = tuple(vram_map[4:])
+        rip.set_vram(vram_tex, vram_pal)
+
+    return rip
+
+
+def le_array(typecode, values):
+    # Packs values as a little-endian array
+    a = array.array(typecode, values)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a.tobytes()
+
+
+def le_u16_view(data):
+    # Returns the little-endian u16s in data as a sequence of ints,
+    # without copying where the machine is little-endian too
+    if sys.byteorder == 'little':
+        return memoryview(data).cast('H')
+    a = array.array('H')
+    a.frombytes(data)
+    a.byteswap()
+    return a
+
+
+def from_le_array(typecode, data):
+    # Inverse of le_array; returns a list
+    a = array.array(typecode)
+    a.frombytes(data)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a.tolist()
+
+
+class DumpIndex:
+    """Offsets of the opcodes in a .dump file, from Rip.scan."""
+
+    def __init__(self):
+        self.polygon_runs = []   # list of PolygonRun
+        self.state_changes = []  # list of (offset, opcode, value) for TPRM/TPLT/PATR
+        self.vram_offset = None  # offsets are to the data after the opcode
+        self.disp_offset = None
+        self.toon_offset = None
+
+    @property
+    def num_polygons(self):
+        """Number of polygons, not counting shadow volumes."""
+        return sum(
+            run.count for run in self.polygon_runs
+            if (run.polygon_attr >> 4) & 3 != 3
+        )
+
+
+# A run of consecutive TRI or QUAD records drawn with the same state.
+# offset is the position of the first record's opcode.
+PolygonRun = namedtuple(
+    'PolygonRun',
+    'offset count nverts texparam texpal polygon_attr',
+)
+
+class PolygonBatch:
+    """A batch of polygons from Rip.iter_polygons. They all come from the
+    same PolygonRun, so they have the same render state and number of
+    verts.
+
+    verts, colors and uvs are in the same format as the Rip attributes
+    of the same name. Each polygon owns nverts consecutive verts; the
+    first vert of the batch is vert number first_vert of the whole dump.
+    """
+
+    def __init__(self, run, count, first_vert, verts, colors, uvs):
+        self.texparam = run.texparam
+        self.texpal = run.texpal
+        self.polygon_attr = run.polygon_attr
+        self.nverts = run.nverts
+        self.count = count
+        self.first_vert = first_vert
+        self.verts = verts
+        self.colors = colors
+        self.uvs = uvs
+
+    @property
+    def material_args(self):
+        return (self.texparam, self.texpal, self.polygon_attr)
+
+
+class PolygonFilter:
+    """Selects which polygons of a dump to import. Rejected polygons are
+    skipped while parsing, so textures and materials that only they use
+    are never decoded or created.
+
+    Each criterion is a collection of the values to keep, or None to keep
+    anything: polygon_ids (polygon_attr bits 24-29), alphas (polygon_attr
+    bits 16-20, 0-31), modes (polygon_attr bits 4-5; 0 modulate, 1 decal,
+    2 toon/highlight) and texture_formats (texparam bits 26-28; 0 is
+    untextured). bounds is ((min x, y, z), (max x, y, z)) in imported
+    coordinates; polygons with a vertex outside it are dropped.
+    """
+
+    def __init__(
+        self,
+        polygon_ids=None,
+        alphas=None,
+        modes=None,
+        texture_formats=None,
+        bounds=None,
+    ):
+        self.polygon_ids = None if polygon_ids is None else frozenset(polygon_ids)
+        self.alphas = None if alphas is None else frozenset(alphas)
+        self.modes = None if modes is None else frozenset(modes)
+        self.texture_formats = None if texture_formats is None else frozenset(texture_formats)
+        self.bounds = bounds
+
+    def accepts_run(self, run):
+        # Checks everything but the bounds, which needs the vertices
+        polygon_attr = run.polygon_attr
+        if self.polygon_ids is not None and (polygon_attr >> 24) & 0x3F not in self.polygon_ids:
+            return False
+        if self.alphas is not None and (polygon_attr >> 16) & 0x1F not in self.alphas:
+            return False
+        if self.modes is not None and (polygon_attr >> 4) & 3 not in self.modes:
+            return False
+        if self.texture_formats is not None and (run.texparam >> 26) & 7 not in self.texture_formats:
+            return False
+        return True
+
+    def keep_in_bounds(self, nverts, verts, colors, uvs):
+        # Drops the polygons (of nverts consecutive vertices each) that
+        # aren't inside the bounds. Returns (count, verts, colors, uvs) of
+        # the ones left.
+        (x0, y0, z0), (x1, y1, z1) = self.bounds
+        kept = [
+            first for first in range(0, len(verts), nverts)
+            if all(
+                x0 <= x <= x1 and y0 <= y <= y1 and z0 <= z <= z1
+                for x, y, z in verts[first : first + nverts]
+            )
+        ]
+        if len(kept) * nverts == len(verts):
+            return len(kept), verts, colors, uvs
+
+        new_verts, new_colors, new_uvs = [], [], []
+        for first in kept:
+            last = first + nverts
+            new_verts += verts[first:last]
+            new_colors += colors[4*first : 4*last]
+            new_uvs += uvs[2*first : 2*last]
+        return len(kept), new_verts, new_colors, new_uvs
+
+
+def parse_polygon_ids(text):
+    """Parses a list of polygon IDs like "0-3, 8" into a set. Raises
+    ShowErrorMsg if it's malformed."""
+    ids = set()
+    for part in text.replace(',', ' ').split():
+        lo, _, hi = part.partition('-')
+        try:
+            lo = int(lo)
+            hi = int(hi) if hi else lo
+        except ValueError:
+            raise ShowErrorMsg('Bad polygon ID list: %r' % text)
+        if not 0 <= lo <= hi <= 63:
+            raise ShowErrorMsg('Polygon IDs must be between 0 and 63')
+        ids.update(range(lo, hi + 1))
+    return ids
+
+
+# Size of one vertex in a TRI/QUAD record
+VERTEX_SIZE = 4*3 + 4*3 + 2*2
+
+# Runs of TRI/QUADs shorter than this are decoded with the scalar loop
+MIN_NUMPY_RUN = 16
+
+# Layout of one vertex in a TRI/QUAD record
+VERTEX_DTYPE = None if np is None else np.dtype([
+    ('pos', '<i4', 3),       # x, y, z in 20.12 fixed point
+    ('color', '<i4', 3),     # r, g, b as transformed by melonDS
+    ('texcoord', '<i2', 2),  # s, t in 12.4 fixed point
+])
+
+
+def polygon_faces(first_vert, count, nverts):
+    """Returns the faces of count polygons of nverts verts each, owning
+    consecutive verts from first_vert."""
+    if np is not None and count >= MIN_NUMPY_RUN:
+        return list(map(tuple, (
+            np.arange(first_vert, first_vert + count*nverts)
+            .reshape(-1, nverts).tolist()
+        )))
+    return [
+        tuple(range(vert_index, vert_index + nverts))
+        for vert_index in range(first_vert, first_vert + count*nverts, nverts)
+    ]
+
+
+def polygon_run_array(dump, run, start=0, count=None):
+    """Returns a structured array viewing count records of a PolygonRun,
+    starting from the start-th (by default, all of them)."""
+    dtype = np.dtype([('op', 'S4'), ('verts', VERTEX_DTYPE, (run.nverts,))])
+    if count is None:
+        count = run.count - start
+    offset = run.offset + start * dtype.itemsize
+    return np.frombuffer(dump, dtype=dtype, count=count, offset=offset)
@@ -0,0 +1,66 @@
+"""Timings and counters for profiling imports. Doesn't depend on bpy."""
+
+import json
+import time
+from contextlib import contextmanager
+
+
+class ImportStats:
+    """Collects per-phase timings and event counters during an import.
+
+    Phase times are exclusive: while a phase nested inside another one is
+    running, the outer phase's clock is paused. So the phase times add up
+    to the total time spent in phases.
+    """
+
+    def __init__(self):
+        self.timings = {}  # phase name -> seconds
+        self.counters = {}  # counter name -> count
+        self.stack = []  # [phase name, start time] of running phases
+
+    @contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            self.pause(self.stack[-1], now)
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.pause(self.stack.pop(), now)
+            if self.stack:
+                self.stack[-1][1] = now  # resume the outer phase
+
+    def pause(self, entry, now):
+        name, start = entry
+        self.timings[name] = self.timings.get(name, 0.0) + (now - start)
+        entry[1] = now
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Adds in the timings and counters from another ImportStats (eg.
+        from a worker process)."""
+        for name, t in other.timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + t
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def report(self):
+        """Returns a human-readable summary."""
+        lines = ['Phase timings:']
+        total = sum(self.timings.values())
+        for name, t in self.timings.items():
+            percent = 100 * t / total if total else 0
+            lines.append(f"  {name:<28} {t:8.3f} s  {percent:5.1f}%")
+        lines.append(f"  {'total':<28} {total:8.3f} s")
+        lines.append('Counters:')
+        for name, n in self.counters.items():
+            lines.append(f"  {name:<28} {n:>10}")
+        return '\n'.join(lines)
+
+    def save_json(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump({'timings': self.timings, 'counters': self.counters}, f, indent=2)
@@ -0,0 +1,687 @@
+"""Texture decoding for MelonRipper .dump files. Doesn't depend on bpy."""
+
+import array
+import concurrent.futures
+import hashlib
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from .compat import np
+from .stats import ImportStats
+
+
+TEXTURE_FORMAT_NAMES = {
+    1: 'A3I5',
+    2: '4-color',
+    3: '16-color',
+    4: '256-color',
+    5: 'compressed',
+    6: 'A5I3',
+    7: 'direct',
+}
+
+
+def texture_cache_key(texparam, texpal):
+    """Key identifying everything decode_texture's result depends on,
+    besides the contents of VRAM."""
+    vramaddr = (texparam & 0xFFFF) << 3
+    width = 8 << ((texparam >> 20) & 7)
+    height = 8 << ((texparam >> 23) & 7)
+    alpha0 = 0 if (texparam & (1<<29)) else 31
+    texformat = (texparam >> 26) & 7
+    # alpha0 only matters for paletted textures
+    if texformat not in [2, 3, 4]:
+        alpha0 = 0
+
+    return (vramaddr, width, height, alpha0, texformat, texpal)
+
+
+def used_textures(rip):
+    """Returns a list of the (texparam, texpal) for every distinct texture
+    used by the rip's materials."""
+    textures = {}
+    for texparam, texpal, _polygon_attr in rip.materials:
+        texformat = (texparam >> 26) & 7
+        if texformat != 0:
+            textures.setdefault(texture_cache_key(texparam, texpal), (texparam, texpal))
+    return list(textures.values())
+
+
+def decode_texture_cached(
+    rip, texparam, texpal,
+    index_cache=None,
+    disk_cache=None,
+    stats=None,
+):
+    """decode_texture, but first looking in an optional TextureDiskCache
+    (and storing the result there on a miss). Timings and counters are
+    recorded in stats, an optional ImportStats."""
+    if stats is None:
+        stats = ImportStats()
+
+    if disk_cache is not None:
+        with stats.phase('texture disk cache'):
+            source_key = texture_source_digest(rip, texparam, texpal)
+            cached = disk_cache.get(source_key)
+        if cached is not None:
+            stats.count('disk cache hits')
+            return cached
+        stats.count('disk cache misses')
+
+    with stats.phase('texture decode'):
+        pixels, is_opaque = decode_texture(rip, texparam, texpal, index_cache)
+    texformat = (texparam >> 26) & 7
+    stats.count('texels decoded (%s)' % TEXTURE_FORMAT_NAMES[texformat], len(pixels) // 4)
+
+    if disk_cache is not None:
+        with stats.phase('texture disk cache'):
+            disk_cache.put(source_key, pixels, is_opaque)
+
+    return pixels, is_opaque
+
+
+def decode_textures(
+    rip, textures,
+    index_cache=None,
+    disk_cache=None,
+    stats=None,
+    jobs=0,
+):
+    """Runs decode_texture_cached on every (texparam, texpal) in textures,
+    in up to jobs threads (0 means one per CPU). Returns a dict mapping
+    texture_cache_key to (pixels, is_opaque).
+
+    The numpy decoders spend much of their time outside the GIL, so the
+    threads can run in parallel; the pure Python decoder can't, and just
+    runs on this thread. Each texture's timings are added into stats, so
+    with several jobs the phase times add up to more than the wall-clock
+    time.
+    """
+    if stats is None:
+        stats = ImportStats()
+    if index_cache is None:
+        index_cache = {}
+    textures = list(textures)
+
+    def decode(texture):
+        # ImportStats isn't thread-safe, so each texture gets its own
+        texture_stats = ImportStats()
+        result = decode_texture_cached(
+            rip, *texture,
+            index_cache=index_cache,
+            disk_cache=disk_cache,
+            stats=texture_stats,
+        )
+        return result, texture_stats
+
+    jobs = min(jobs or os.cpu_count() or 1, len(textures))
+    if np is None or jobs <= 1:
+        results = map(decode, textures)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(decode, textures))
+
+    decoded = {}
+    for (texparam, texpal), (result, texture_stats) in zip(textures, results):
+        decoded[texture_cache_key(texparam, texpal)] = result
+        stats.merge(texture_stats)
+    return decoded
+
+
+def decode_texture(rip, texparam, texpal, index_cache=None):
+    """Decodes a texture from VRAM. Returns (pixels, is_opaque), where
+    pixels are the RGBA floats for the image, bottom row first.
+
+    index_cache is an optional dict for sharing the decoded texels of
+    palette textures between calls that only differ in the palette.
+    """
+    texformat = (texparam >> 26) & 7
+    if np is not None and texformat in NUMPY_TEXFORMATS:
+        return decode_texture_numpy(rip, texparam, texpal, index_cache)
+    return decode_texture_scalar(rip, texparam, texpal)
+
+
+def texture_source_digest(rip, texparam, texpal):
+    """Hash of everything in VRAM and texparam that the result of
+    decode_texture(rip, texparam, texpal) depends on."""
+    vramaddr, width, height, alpha0, texformat, texpal = texture_cache_key(texparam, texpal)
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(struct.pack('<5I', TEXTURE_DECODER_VERSION, width, height, alpha0, texformat))
+
+    bpp = {1: 8, 2: 2, 3: 4, 4: 8, 5: 2, 6: 8, 7: 16}[texformat]
+    h.update(wrapped_slice(rip.vram_tex, vramaddr, width*height*bpp//8, 0x80000))
+
+    if texformat == 1: palette = (texpal << 3, 32)
+    elif texformat == 6: palette = (texpal << 3, 8)
+    elif texformat == 2: palette = (texpal << 2, 4)
+    elif texformat == 3: palette = (texpal << 3, 16)
+    elif texformat == 4: palette = (texpal << 3, 256)
+    elif texformat == 5:
+        # Slot1 palette info for the blocks, and all the palette it
+        # can reach
+        slot1 = compressed_slot1_data(rip, vramaddr, width*height//16)
+        h.update(slot1)
+        palinfo = array.array('H', slot1)
+        if sys.byteorder == 'big':
+            palinfo.byteswap()
+        max_offset = max((p & 0x3FFF) << 1 for p in palinfo)
+        palette = (texpal << 3, max_offset + 4)
+    else:
+        palette = None
+
+    if palette:
+        start, count = palette
+        entries = [rip.vram_pal[(start + i) & 0xFFFF] for i in range(count)]
+        h.update(struct.pack('<%dH' % count, *entries))
+
+    return h.digest()
+
+
+def wrapped_slice(buf, start, size, wrap):
+    """buf[start:start+size], with addresses wrapping around at wrap."""
+    start %= wrap
+    if start + size <= wrap:
+        return bytes(buf[start:start + size])
+    data = bytearray()
+    while size > 0:
+        n = min(size, wrap - start)
+        data += buf[start:start + n]
+        size -= n
+        start = 0
+    return bytes(data)
+
+
+def compressed_slot1_data(rip, vramaddr, num_blocks):
+    # The slot1 palette info words of every block of a compressed texture
+    # (see decode_texture_scalar), concatenated.
+    data = bytearray()
+    addr = vramaddr
+    end = vramaddr + num_blocks*4
+    while addr < end:
+        # Slot1 addresses are consecutive up to the next 128K boundary
+        seg_end = min(end, (addr | 0x1FFFF) + 1)
+        slot1addr = 0x20000 + ((addr & 0x1FFFC) >> 1)
+        if addr >= 0x40000:
+            slot1addr += 0x10000
+        data += rip.vram_tex[slot1addr : slot1addr + (seg_end - addr)//2]
+        addr = seg_end
+    return bytes(data)
+
+
+# Bump when decode_texture output changes, to invalidate on-disk caches
+TEXTURE_DECODER_VERSION = 1
+
+
+class TextureDiskCache:
+    """On-disk cache of decoded textures, keyed by texture_source_digest.
+
+    Each entry is a file storing the 5-bit channel values of the pixels.
+    Files are touched when used, and trim() deletes the least recently
+    used files until the cache is under max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, key.hex() + '.tex')
+
+    def get(self, key):
+        """Returns (pixels, is_opaque) or None on a miss."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+            values = zlib.decompress(data[1:])
+        except (OSError, zlib.error):
+            return None
+
+        is_opaque = data[0] == 1
+        if np is not None:
+            pixels = FIVE_BIT_TO_FLOAT[np.frombuffer(values, dtype=np.uint8)]
+        else:
+            pixels = [v/31 for v in values]
+        return pixels, is_opaque
+
+    def put(self, key, pixels, is_opaque):
+        if np is not None and isinstance(pixels, np.ndarray):
+            values = np.rint(pixels * 31).astype(np.uint8).tobytes()
+        else:
+            values = bytes(round(p * 31) for p in pixels)
+        data = bytes([is_opaque]) + zlib.compress(values, 1)
+
+        # Write to a temp file first so readers never see a partial entry
+        path = self.path(key)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Couldn't write to texture cache: {e}")
+
+    def trim(self):
+        try:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.tex'):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()  # oldest first
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def pixels_digest(pixels):
+    """Hash of the contents of a pixel buffer from decode_texture."""
+    if np is not None and isinstance(pixels, np.ndarray):
+        data = pixels.astype(np.float32, copy=False).tobytes()
+    else:
+        data = array.array('f', pixels).tobytes()
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def decode_texture_scalar(rip, texparam, texpal):
+    # Pure Python decoder. Slow, but works without numpy and serves as
+    # the reference for the numpy decoders.
+    color = []
+    alpha = []
+
+    vramaddr, width, height, alpha0, texformat, texpal = texture_cache_key(texparam, texpal)
+
+    vram_tex = rip.vram_tex
+    vram_pal = rip.vram_pal
+
+    if texformat == 1:  # A3I5
+        texpal <<= 3
+        for addr in range(vramaddr, vramaddr + width*height):
+            pixel = vram_tex[addr & 0x7FFFF]
+            color.append(vram_pal[( texpal + (pixel&0x1F) ) & 0xFFFF])
+            alpha.append( ((pixel>>3) & 0x1C) + (pixel>>6) )
+
+    elif texformat == 6:  # A5I3
+        texpal <<= 3
+        for addr in range(vramaddr, vramaddr + width*height):
+            pixel = vram_tex[addr & 0x7FFFF]
+            color.append(vram_pal[( texpal + (pixel&0x7) ) & 0xFFFF])
+            alpha.append(pixel>>3)
+
+    elif texformat == 2:  # 4-color
+        texpal <<= 2
+        for addr in range(vramaddr, vramaddr + width*height//4):
+            pixelx4 = vram_tex[addr & 0x7FFFF]
+            p0 = pixelx4 & 0x3
+            p1 = (pixelx4 >> 2) & 0x3
+            p2 = (pixelx4 >> 4) & 0x3
+            p3 = pixelx4 >> 6
+
+            color.append(vram_pal[( texpal + p0 ) & 0xFFFF])
+            color.append(vram_pal[( texpal + p1 ) & 0xFFFF])
+            color.append(vram_pal[( texpal + p2 ) & 0xFFFF])
+            color.append(vram_pal[( texpal + p3 ) & 0xFFFF])
+
+            alpha.append(alpha0 if p0==0 else 31)
+            alpha.append(alpha0 if p1==0 else 31)
+            alpha.append(alpha0 if p2==0 else 31)
+            alpha.append(alpha0 if p3==0 else 31)
+
+    elif texformat == 3:  # 16-color
+        texpal <<= 3
+        for addr in range(vramaddr, vramaddr + width*height//2):
+            pixelx2 = vram_tex[addr & 0x7FFFF]
+            p0 = pixelx2 & 0xF
+            p1 = pixelx2 >> 4
+
+            color.append(vram_pal[( texpal + p0 ) & 0xFFFF])
+            color.append(vram_pal[( texpal + p1 ) & 0xFFFF])
+
+            alpha.append(alpha0 if p0==0 else 31)
+            alpha.append(alpha0 if p1==0 else 31)
+
+    elif texformat == 4:  # 256-color
+        texpal <<= 3
+        for addr in range(vramaddr, vramaddr + width*height):
+            pixel = vram_tex[addr & 0x7FFFF]
+            color.append(vram_pal[( texpal + pixel ) & 0xFFFF])
+            alpha.append(alpha0 if pixel==0 else 31)
+
+    elif texformat == 7:  # direct color
+        for addr in range(vramaddr, vramaddr + width*height*2, 2):
+            pixel = rip.vram_tex[addr & 0x7FFFF]
+            pixel |= rip.vram_tex[(addr+1) & 0x7FFFF] << 8
+            color.append(pixel)
+            alpha.append(31 if (pixel & 0x8000) else 0)
+
+    elif texformat == 5:  # compressed
+        color = [0] * (width * height)
+        alpha = [0] * (width * height)
+        block_color = [0, 0, 0, 0]
+        block_alpha = [31, 31, 31, 31]
+        x_ofs = 0
+        y_ofs = 0
+
+        texpal <<= 3
+
+        for addr in range(vramaddr, vramaddr + width*height//4, 4):
+
+            # Read slot1 data for this block
+
+            slot1addr = 0x20000 + ((addr & 0x1FFFC) >> 1)
+            if addr >= 0x40000:
+                slot1addr += 0x10000
+
+            palinfo = vram_tex[slot1addr & 0x7FFFF]
+            palinfo |= vram_tex[(slot1addr + 1) & 0x7FFFF] << 8
+            paloffset = texpal + ((palinfo & 0x3FFF) << 1)
+            palmode = palinfo >> 14
+
+            # Calculate block CLUT
+
+            col0 = vram_pal[( paloffset ) & 0xFFFF]
+            col1 = vram_pal[( paloffset + 1 ) & 0xFFFF]
+            block_color[0] = col0
+            block_color[1] = col1
+            block_alpha[3] = 31 if palmode >= 2 else 0
+
+            if palmode == 0:
+                block_color[2] = vram_pal[( paloffset + 2 ) & 0xFFFF]
+                block_color[3] = 0
+
+            elif palmode == 2:
+                block_color[2] = vram_pal[( paloffset + 2 ) & 0xFFFF]
+                block_color[3] = vram_pal[( paloffset + 3 ) & 0xFFFF]
+
+            elif palmode == 1:
+                r0 = col0 & 0x001F
+                g0 = col0 & 0x03E0
+                b0 = col0 & 0x7C00
+                r1 = col1 & 0x001F
+                g1 = col1 & 0x03E0
+                b1 = col1 & 0x7C00
+
+                r2 = (r0 + r1) >> 1
+                g2 = ((g0 + g1) >> 1) & 0x03E0
+                b2 = ((b0 + b1) >> 1) & 0x7C00
+
+                block_color[2] = r2 | g2 | b2
+                block_color[3] = 0
+
+            else:
+                r0 = col0 & 0x001F
+                g0 = col0 & 0x03E0
+                b0 = col0 & 0x7C00
+                r1 = col1 & 0x001F
+                g1 = col1 & 0x03E0
+                b1 = col1 & 0x7C00
+
+                r2 = (r0*5 + r1*3) >> 3
+                g2 = ((g0*5 + g1*3) >> 3) & 0x03E0
+                b2 = ((b0*5 + b1*3) >> 3) & 0x7C00
+
+                r3 = (r0*3 + r1*5) >> 3
+                g3 = ((g0*3 + g1*5) >> 3) & 0x03E0
+                b3 = ((b0*3 + b1*5) >> 3) & 0x7C00
+
+                block_color[2] = r2 | g2 | b2
+                block_color[3] = r3 | g3 | b3
+
+            # Read block of 4x4 pixels at addr
+            # 2bpp indices into the block CLUT
+
+            for y in range(4):
+                ofs = y_ofs + y*width + x_ofs
+
+                pixelx4 = vram_tex[(addr + y) & 0x7FFFF]
+
+                p0 = pixelx4 & 0x3
+                p1 = (pixelx4 >> 2) & 0x3
+                p2 = (pixelx4 >> 4) & 0x3
+                p3 = pixelx4 >> 6
+
+                color[ofs] = block_color[p0]
+                color[ofs+1] = block_color[p1]
+                color[ofs+2] = block_color[p2]
+                color[ofs+3] = block_color[p3]
+
+                alpha[ofs] = block_alpha[p0]
+                alpha[ofs+1] = block_alpha[p1]
+                alpha[ofs+2] = block_alpha[p2]
+                alpha[ofs+3] = block_alpha[p3]
+
+            # Advance to next block position
+
+            x_ofs += 4
+            if x_ofs == width:
+                x_ofs = 0
+                y_ofs += 4*width
+
+    # Decode to floats
+    # Also reverse the rows so the image is right-side-up
+    pixels = []
+    for t in reversed(range(height)):
+        for i in range(t*width, (t+1)*width):
+            c, a = color[i], alpha[i]
+            r = c & 0x1f
+            g = (c >> 5) & 0x1f
+            b = (c >> 10) & 0x1f
+            pixels += [r/31, g/31, b/31, a/31]
+
+    is_opaque = all(a == 31 for a in alpha)
+
+    return pixels, is_opaque
+
+
+# Formats decode_texture_numpy handles
+NUMPY_TEXFORMATS = [1, 2, 3, 4, 5, 6, 7]
+
+# RGB555 channel or 5-bit alpha -> float
+FIVE_BIT_TO_FLOAT = None if np is None else (np.arange(32) / 31).astype(np.float32)
+
+
+def decode_texture_numpy(rip, texparam, texpal, index_cache=None):
+    # Same as decode_texture_scalar, but vectorized with numpy.
+    vramaddr, width, height, _alpha0, texformat, texpal = texture_cache_key(texparam, texpal)
+
+    if texformat in PALETTE_TEXFORMATS:
+        # The texels don't depend on the palette, so they can be shared
+        # by all the palettes the texture is drawn with.
+        cache_key = (vramaddr, width, height, texformat)
+        if index_cache is not None and cache_key in index_cache:
+            index_image = index_cache[cache_key]
+        else:
+            index_image = decode_index_image(rip, texparam)
+            if index_cache is not None:
+                index_cache[cache_key] = index_image
+
+        return apply_palette(rip, index_image, texparam, texpal)
+
+    elif texformat == 7:  # direct color
+        color = read_vram(rip, vramaddr, width*height*2).view('<u2')
+        alpha = np.where(color & 0x8000, 31, 0)
+
+    elif texformat == 5:  # compressed
+        color, alpha = decode_compressed_numpy(rip, vramaddr, width, height, texpal)
+
+    return rgb555_to_pixels(color, alpha, width, height)
+
+
+# Formats where each texel is looked up in a palette: A3I5, 4-color,
+# 16-color, 256-color, A5I3
+PALETTE_TEXFORMATS = [1, 2, 3, 4, 6]
+
+
+def decode_index_image(rip, texparam):
+    """Decodes the texels of a palette texture. Returns (texels, used),
+    where texels is a uint8 array of the raw texel values (bottom row
+    first), and used[v] tells whether value v occurs in it."""
+    vramaddr = (texparam & 0xFFFF) << 3
+    width = 8 << ((texparam >> 20) & 7)
+    height = 8 << ((texparam >> 23) & 7)
+    texformat = (texparam >> 26) & 7
+
+    bpp = {1: 8, 2: 2, 3: 4, 4: 8, 6: 8}[texformat]
+    packed = read_vram(rip, vramaddr, width*height*bpp//8)
+    if bpp == 8:
+        texels = packed
+    else:
+        # Unpack texels from each byte, lowest bits first
+        shifts = np.arange(0, 8, bpp, dtype=np.uint8)
+        texels = (packed[:, None] >> shifts) & ((1 << bpp) - 1)
+
+    # Reverse the rows so the image is right-side-up
+    texels = np.ascontiguousarray(texels.reshape(height, width)[::-1])
+    used = np.bincount(texels.reshape(-1), minlength=1 << bpp) != 0
+
+    return texels, used
+
+
+def apply_palette(rip, index_image, texparam, texpal):
+    """Produces the pixels of a palette texture from its index image (see
+    decode_index_image) by looking every texel value up in a LUT."""
+    texels, used = index_image
+    alpha0 = 0 if (texparam & (1<<29)) else 31
+    texformat = (texparam >> 26) & 7
+
+    # Compute the color and alpha for every possible texel value
+    value = np.arange(len(used))
+    if texformat == 1:  # A3I5
+        index = value & 0x1F
+        alpha = ((value>>3) & 0x1C) + (value>>6)
+    elif texformat == 6:  # A5I3
+        index = value & 0x7
+        alpha = value >> 3
+    else:
+        index = value
+        alpha = np.where(value == 0, alpha0, 31)
+    texpal <<= 2 if texformat == 2 else 3
+    color = rip.vram_pal_array[(texpal + index) & 0xFFFF]
+
+    lut = np.empty((len(used), 4), dtype=np.float32)
+    lut[:, 0] = FIVE_BIT_TO_FLOAT[color & 0x1f]
+    lut[:, 1] = FIVE_BIT_TO_FLOAT[(color >> 5) & 0x1f]
+    lut[:, 2] = FIVE_BIT_TO_FLOAT[(color >> 10) & 0x1f]
+    lut[:, 3] = FIVE_BIT_TO_FLOAT[alpha]
+
+    pixels = lut[texels].reshape(-1)
+    is_opaque = bool(np.all(alpha[used] == 31))
+
+    return pixels, is_opaque
+
+
+def decode_compressed_numpy(rip, vramaddr, width, height, texpal):
+    # Decodes all 4x4 blocks of a compressed texture at once. Returns
+    # (color, alpha) arrays, top row first.
+    vram_tex = np.frombuffer(rip.vram_tex, dtype=np.uint8)
+    vram_pal = rip.vram_pal_array
+
+    num_blocks = width*height // 16
+    texpal <<= 3
+
+    addr = vramaddr + 4*np.arange(num_blocks, dtype=np.int64)
+
+    # Gather slot1 palette info for every block
+
+    slot1addr = 0x20000 + ((addr & 0x1FFFC) >> 1)
+    slot1addr[addr >= 0x40000] += 0x10000
+
+    palinfo = vram_tex[slot1addr & 0x7FFFF].astype(np.int64)
+    palinfo |= vram_tex[(slot1addr + 1) & 0x7FFFF].astype(np.int64) << 8
+    paloffset = texpal + ((palinfo & 0x3FFF) << 1)
+    palmode = palinfo >> 14
+
+    # Build the 4-entry CLUT of every block, for all palmodes at once
+
+    pal_colors = vram_pal[(paloffset[:, None] + np.arange(4)) & 0xFFFF]
+    pal_colors = pal_colors.astype(np.int64)
+    col0 = pal_colors[:, 0]
+    col1 = pal_colors[:, 1]
+
+    r0 = col0 & 0x001F ; g0 = col0 & 0x03E0 ; b0 = col0 & 0x7C00
+    r1 = col1 & 0x001F ; g1 = col1 & 0x03E0 ; b1 = col1 & 0x7C00
+
+    half = (
+        ((r0 + r1) >> 1) |
+        (((g0 + g1) >> 1) & 0x03E0) |
+        (((b0 + b1) >> 1) & 0x7C00)
+    )
+    five_three = (
+        ((r0*5 + r1*3) >> 3) |
+        (((g0*5 + g1*3) >> 3) & 0x03E0) |
+        (((b0*5 + b1*3) >> 3) & 0x7C00)
+    )
+    three_five = (
+        ((r0*3 + r1*5) >> 3) |
+        (((g0*3 + g1*5) >> 3) & 0x03E0) |
+        (((b0*3 + b1*5) >> 3) & 0x7C00)
+    )
+
+    block_color = pal_colors.copy()
+    block_color[:, 3] = np.where(palmode == 2, pal_colors[:, 3], 0)
+    block_color[palmode == 1, 2] = half[palmode == 1]
+    block_color[palmode == 3, 2] = five_three[palmode == 3]
+    block_color[palmode == 3, 3] = three_five[palmode == 3]
+
+    block_alpha = np.full((num_blocks, 4), 31, dtype=np.int64)
+    block_alpha[:, 3] = np.where(palmode >= 2, 31, 0)
+
+    # Look up the 2bpp texel indices in the block CLUTs
+
+    packed = read_vram(rip, vramaddr, num_blocks*4)
+    index = (packed[:, None] >> np.arange(0, 8, 2, dtype=np.uint8)) & 0x3
+    index = index.reshape(num_blocks, 16).astype(np.int64)
+
+    color = np.take_along_axis(block_color, index, axis=1)
+    alpha = np.take_along_axis(block_alpha, index, axis=1)
+
+    # Scatter the blocks into the image. Blocks are in row-major order,
+    # and each is 4 rows of 4 texels.
+    def unblock(a):
+        a = a.reshape(height//4, width//4, 4, 4)
+        return a.transpose(0, 2, 1, 3).reshape(-1)
+
+    return unblock(color), unblock(alpha)
+
+
+def read_vram(rip, addr, size):
+    """Returns size bytes of texture VRAM at addr as a uint8 array,
+    wrapping around at the end of VRAM."""
+    vram_tex = np.frombuffer(rip.vram_tex, dtype=np.uint8)
+    addr &= 0x7FFFF
+    if addr + size <= len(vram_tex):
+        return vram_tex[addr:addr + size]
+    return np.take(vram_tex, np.arange(addr, addr + size), mode='wrap')
+
+
+def rgb555_to_pixels(color, alpha, width, height):
+    """Converts arrays of RGB555 colors and 5-bit alphas (top row first)
+    to the flat float32 RGBA pixel buffer for a Blender image."""
+    pixels = np.empty((height, width, 4), dtype=np.float32)
+    # Reverse the rows so the image is right-side-up
+    color = color.reshape(height, width)[::-1]
+    alpha = alpha.reshape(height, width)[::-1]
+    pixels[:, :, 0] = FIVE_BIT_TO_FLOAT[color & 0x1f]
+    pixels[:, :, 1] = FIVE_BIT_TO_FLOAT[(color >> 5) & 0x1f]
+    pixels[:, :, 2] = FIVE_BIT_TO_FLOAT[(color >> 10) & 0x1f]
+    pixels[:, :, 3] = FIVE_BIT_TO_FLOAT[alpha]
+
+    is_opaque = bool(np.all(alpha == 31))
+
+    return pixels.reshape(-1), is_opaque